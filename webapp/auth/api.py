@@ -1,18 +1,38 @@
 """
 API endpoints for authentication
 """
-from fastapi import APIRouter, HTTPException, Request, Depends
-from fastapi.responses import JSONResponse
+import asyncio
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Request, Depends
+from fastapi.responses import JSONResponse, ORJSONResponse
+from starlette.concurrency import run_in_threadpool
 from typing import Optional, Dict
 from .models import LoginRequest, RegisterRequest, AuthResponse, UserProfile
-from .auth_manager import AuthManager
-from .database import AuthDB
+from .auth_manager import get_auth_manager
+from .database import get_auth_db
+
+try:
+    import orjson
+except ImportError:  # optional speedup; fall back to the stdlib encoder
+    orjson = None
 
 router = APIRouter(prefix="/auth", tags=["authentication"])
 
-# Initialize auth manager and database
-auth_manager = AuthManager()
-auth_db = AuthDB()
+# Shared auth manager and database (one AuthDB per process)
+auth_manager = get_auth_manager()
+auth_db = get_auth_db()
+
+SESSION_CLEANUP_INTERVAL = 300  # seconds
+
+
+async def periodic_session_cleanup(interval: float = SESSION_CLEANUP_INTERVAL):
+    """Remove expired sessions every `interval` seconds until cancelled"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_in_threadpool(auth_manager.cleanup_expired_sessions)
+        except Exception:
+            # Keep the loop alive; the next tick retries
+            pass
 
 
 def get_client_info(request: Request) -> tuple:
@@ -23,146 +43,114 @@ def get_client_info(request: Request) -> tuple:
 
 
 @router.post("/register", response_model=AuthResponse)
-async def register(request: RegisterRequest, http_request: Request):
+def register(request: RegisterRequest, http_request: Request):
     """Register a new user"""
-    try:
-        response = auth_manager.register_user(request)
-        return response
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    response = auth_manager.register_user(request)
+    return response
 
 
 @router.post("/login", response_model=AuthResponse)
-async def login(request: LoginRequest, http_request: Request):
+def login(request: LoginRequest, http_request: Request, background_tasks: BackgroundTasks):
     """Login user and create session"""
-    try:
-        ip_address, user_agent = get_client_info(http_request)
-        response = auth_manager.login_user(request, ip_address, user_agent)
-        return response
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    ip_address, user_agent = get_client_info(http_request)
+    response = auth_manager.login_user(request, ip_address, user_agent, background_tasks)
+    return response
 
 
 @router.post("/logout")
-async def logout(session_id: str):
+def logout(session_id: str):
     """Logout user by removing session"""
-    try:
-        success = auth_manager.logout_user(session_id)
-        if success:
-            return {"success": True, "message": "Logged out successfully"}
-        else:
-            raise HTTPException(status_code=400, detail="Invalid session")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    success = auth_manager.logout_user(session_id)
+    if success:
+        return {"success": True, "message": "Logged out successfully"}
+    else:
+        raise HTTPException(status_code=400, detail="Invalid session")
 
 
 @router.get("/session/{session_id}")
-async def validate_session(session_id: str):
+def validate_session(session_id: str):
     """Validate session and return user info"""
-    try:
-        is_valid, user = auth_manager.validate_session(session_id)
-        if is_valid and user:
-            return {
-                "valid": True,
-                "user_id": user.user_id,
-                "username": user.username,
-                "email": user.email
-            }
-        else:
-            return {"valid": False}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    is_valid, user = auth_manager.validate_session(session_id)
+    if is_valid and user:
+        return {
+            "valid": True,
+            "user_id": user.user_id,
+            "username": user.username,
+            "email": user.email
+        }
+    else:
+        return {"valid": False}
 
 
 @router.get("/profile/{user_id}")
-async def get_user_profile(user_id: str):
+def get_user_profile(user_id: str):
     """Get user profile"""
-    try:
-        profile = auth_db.get_user_profile(user_id)
-        if profile:
-            return profile.dict()
-        else:
-            raise HTTPException(status_code=404, detail="User not found")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    profile = auth_db.get_user_profile(user_id)
+    if profile:
+        return profile.model_dump()
+    else:
+        raise HTTPException(status_code=404, detail="User not found")
 
 
 @router.put("/profile/{user_id}")
-async def update_user_profile(user_id: str, profile_data: Dict):
+def update_user_profile(user_id: str, profile_data: Dict):
     """Update user profile"""
-    try:
-        success, message = auth_manager.update_profile(user_id, profile_data)
-        if success:
-            return {"success": True, "message": message}
-        else:
-            raise HTTPException(status_code=400, detail=message)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    success, message = auth_manager.update_profile(user_id, profile_data)
+    if success:
+        return {"success": True, "message": message}
+    else:
+        raise HTTPException(status_code=400, detail=message)
 
 
 @router.post("/change-password/{user_id}")
-async def change_password(user_id: str, password_data: Dict):
+def change_password(user_id: str, password_data: Dict):
     """Change user password"""
-    try:
-        old_password = password_data.get("old_password")
-        new_password = password_data.get("new_password")
-        
-        if not old_password or not new_password:
-            raise HTTPException(status_code=400, detail="Old and new passwords are required")
-        
-        success, message = auth_manager.change_password(user_id, old_password, new_password)
-        if success:
-            return {"success": True, "message": message}
-        else:
-            raise HTTPException(status_code=400, detail=message)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    old_password = password_data.get("old_password")
+    new_password = password_data.get("new_password")
+    
+    if not old_password or not new_password:
+        raise HTTPException(status_code=400, detail="Old and new passwords are required")
+    
+    success, message = auth_manager.change_password(user_id, old_password, new_password)
+    if success:
+        return {"success": True, "message": message}
+    else:
+        raise HTTPException(status_code=400, detail=message)
 
 
 @router.get("/stats/{user_id}")
-async def get_user_stats(user_id: str):
+def get_user_stats(user_id: str):
     """Get user statistics for dashboard"""
-    try:
-        stats = auth_manager.get_user_stats(user_id)
-        if stats:
-            return stats
-        else:
-            raise HTTPException(status_code=404, detail="User not found")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    stats = auth_manager.get_user_stats(user_id)
+    if stats:
+        return stats
+    else:
+        raise HTTPException(status_code=404, detail="User not found")
 
 
 @router.get("/users")
-async def get_all_users():
+def get_all_users():
     """Get all users (admin only)"""
-    try:
-        users = auth_manager.get_all_users()
-        return [{"user_id": user.user_id, "username": user.username, "is_active": user.is_active} for user in users]
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    # Plain dicts need no validation; hand them straight to the encoder
+    response_class = ORJSONResponse if orjson is not None else JSONResponse
+    return response_class(auth_manager.get_user_summaries())
 
 
 @router.post("/cleanup-sessions")
-async def cleanup_sessions():
+def cleanup_sessions():
     """Clean up expired sessions"""
-    try:
-        auth_manager.cleanup_expired_sessions()
-        return {"success": True, "message": "Expired sessions cleaned up"}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    auth_manager.cleanup_expired_sessions()
+    return {"success": True, "message": "Expired sessions cleaned up"}
 
 
 @router.get("/health")
-async def auth_health():
+def auth_health():
     """Health check for auth service"""
-    try:
-        user_count = auth_db.get_user_count()
-        active_sessions = auth_db.get_active_sessions_count()
-        
-        return {
-            "status": "healthy",
-            "user_count": user_count,
-            "active_sessions": active_sessions
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    user_count = auth_db.get_user_count()
+    active_sessions = auth_db.get_active_sessions_count()
+    
+    return {
+        "status": "healthy",
+        "user_count": user_count,
+        "active_sessions": active_sessions
+    }
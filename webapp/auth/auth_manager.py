@@ -1,48 +1,81 @@
 """
 Authentication manager for handling login, logout, and session management
 """
-from typing import Optional, Tuple
+from base64 import urlsafe_b64encode
+from collections import deque
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
 from datetime import datetime
-import secrets
+import os
+import threading
+import time
+from fastapi import BackgroundTasks
 from .models import User, UserSession, LoginRequest, RegisterRequest, AuthResponse
-from .database import AuthDB
+from .database import AuthDB, get_auth_db
+
+
+# User ids are drawn from a pool filled by one os.urandom call per batch
+_ID_BATCH_SIZE = 256
+_ID_BYTES = 16
+_id_pool: deque = deque()
+_id_pool_lock = threading.Lock()
+
+# validate_session results are kept for a short while to skip the DB lookups.
+# The cache is per process: a logout or deactivation in one worker does not
+# reach another worker's cache, so a session stays valid there for up to the
+# TTL. With several workers (WEB_CONCURRENCY > 1) caching is off unless
+# SESSION_CACHE_TTL is set explicitly.
+_SESSION_CACHE_TTL = float(os.environ.get(
+    "SESSION_CACHE_TTL", 0 if int(os.environ.get("WEB_CONCURRENCY", 1)) > 1 else 60
+))  # seconds
+_SESSION_CACHE_MAX = 10000
+
+# Fixed failure responses, built once instead of per call
+_ERR_MISSING_FIELDS = AuthResponse(success=False, message="Username and password are required")
+_ERR_PASSWORD_MISMATCH = AuthResponse(success=False, message="Passwords do not match")
+_ERR_PASSWORD_TOO_SHORT = AuthResponse(success=False, message="Password must be at least 6 characters long")
+_ERR_USERNAME_TAKEN = AuthResponse(success=False, message="Username already exists")
+_ERR_CREATE_FAILED = AuthResponse(success=False, message="Failed to create user")
+_ERR_BAD_CREDENTIALS = AuthResponse(success=False, message="Invalid username or password")
+_ERR_INACTIVE = AuthResponse(success=False, message="Account is deactivated")
+_ERR_SESSION_FAILED = AuthResponse(success=False, message="Failed to create session")
+
+
+def _refill_id_pool():
+    """Generate a batch of url-safe ids (same format as secrets.token_urlsafe(16))"""
+    buf = os.urandom(_ID_BYTES * _ID_BATCH_SIZE)
+    _id_pool.extend(
+        urlsafe_b64encode(buf[i:i + _ID_BYTES]).rstrip(b"=").decode("ascii")
+        for i in range(0, len(buf), _ID_BYTES)
+    )
 
 
 class AuthManager:
     """Main authentication manager"""
     
-    def __init__(self):
-        self.db = AuthDB()
+    def __init__(self, db: Optional[AuthDB] = None):
+        self.db = db if db is not None else get_auth_db()
+        # session_id -> (monotonic deadline, user)
+        self._session_cache: Dict[str, Tuple[float, User]] = {}
+        self._session_cache_lock = threading.Lock()
     
     def register_user(self, request: RegisterRequest) -> AuthResponse:
         """Register a new user"""
         try:
             # Validate input
             if not request.username or not request.password:
-                return AuthResponse(
-                    success=False,
-                    message="Username and password are required"
-                )
+                return _ERR_MISSING_FIELDS
             
             if request.password != request.confirm_password:
-                return AuthResponse(
-                    success=False,
-                    message="Passwords do not match"
-                )
+                return _ERR_PASSWORD_MISMATCH
             
             if len(request.password) < 6:
-                return AuthResponse(
-                    success=False,
-                    message="Password must be at least 6 characters long"
-                )
+                return _ERR_PASSWORD_TOO_SHORT
             
             # Check if username already exists
             existing_user = self.db.get_user_by_username(request.username)
             if existing_user:
-                return AuthResponse(
-                    success=False,
-                    message="Username already exists"
-                )
+                return _ERR_USERNAME_TAKEN
             
             # Create new user
             user_id = self._generate_user_id()
@@ -63,10 +96,7 @@ class AuthManager:
                     username=user.username
                 )
             else:
-                return AuthResponse(
-                    success=False,
-                    message="Failed to create user"
-                )
+                return _ERR_CREATE_FAILED
                 
         except Exception as e:
             return AuthResponse(
@@ -75,34 +105,35 @@ class AuthManager:
             )
     
     def login_user(self, request: LoginRequest, ip_address: str = None, 
-                   user_agent: str = None) -> AuthResponse:
+                   user_agent: str = None,
+                   background_tasks: Optional[BackgroundTasks] = None) -> AuthResponse:
         """Authenticate user and create session"""
         try:
             # Find user by username
             user = self.db.get_user_by_username(request.username)
             if not user:
-                return AuthResponse(
-                    success=False,
-                    message="Invalid username or password"
-                )
+                # Hash anyway so unknown usernames take as long as bad passwords
+                User._hash_password(request.password)
+                return _ERR_BAD_CREDENTIALS
             
             # Check password
             if not user.check_password(request.password):
-                return AuthResponse(
-                    success=False,
-                    message="Invalid username or password"
-                )
+                return _ERR_BAD_CREDENTIALS
             
             # Check if user is active
             if not user.is_active:
-                return AuthResponse(
-                    success=False,
-                    message="Account is deactivated"
-                )
+                return _ERR_INACTIVE
             
-            # Update last login
-            user.last_login = datetime.now()
-            self.db.update_user(user)
+            # Upgrade old SHA-256 hashes now that we know the plain password
+            if user.needs_rehash():
+                user.set_password(request.password)
+                self.db.update_user(user)
+            
+            # Update last login; deferred until after the response when possible
+            if background_tasks is not None:
+                background_tasks.add_task(self.db.update_last_login, user.user_id, datetime.now())
+            else:
+                self.db.update_last_login(user.user_id, datetime.now())
             
             # Create session
             session = UserSession.create_new(
@@ -120,10 +151,7 @@ class AuthManager:
                     username=user.username
                 )
             else:
-                return AuthResponse(
-                    success=False,
-                    message="Failed to create session"
-                )
+                return _ERR_SESSION_FAILED
                 
         except Exception as e:
             return AuthResponse(
@@ -134,13 +162,22 @@ class AuthManager:
     def logout_user(self, session_id: str) -> bool:
         """Logout user by removing session"""
         try:
-            return self.db.remove_session(session_id)
+            # Drop again after the write in case a concurrent validate
+            # re-cached the session from the old row in between
+            self._drop_cached_session(session_id)
+            removed = self.db.remove_session(session_id)
+            self._drop_cached_session(session_id)
+            return removed
         except Exception:
             return False
     
     def validate_session(self, session_id: str) -> Tuple[bool, Optional[User]]:
         """Validate session and return user if valid"""
         try:
+            cached_user = self._get_cached_session(session_id)
+            if cached_user:
+                return True, cached_user
+            
             session = self.db.get_session(session_id)
             if not session:
                 return False, None
@@ -149,10 +186,51 @@ class AuthManager:
             if not user or not user.is_active:
                 return False, None
             
+            self._cache_session(session, user)
             return True, user
         except Exception:
             return False, None
     
+    def _get_cached_session(self, session_id: str) -> Optional[User]:
+        """Return the cached user for a session if the entry is still fresh"""
+        with self._session_cache_lock:
+            entry = self._session_cache.get(session_id)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._session_cache[session_id]
+                return None
+            return entry[1]
+    
+    def _cache_session(self, session: UserSession, user: User):
+        """Remember a validated session, never past its own expiry"""
+        ttl = min(_SESSION_CACHE_TTL, (session.expires_at - datetime.now()).total_seconds())
+        if ttl <= 0:
+            return
+        now = time.monotonic()
+        with self._session_cache_lock:
+            if len(self._session_cache) >= _SESSION_CACHE_MAX:
+                self._session_cache = {
+                    sid: entry for sid, entry in self._session_cache.items()
+                    if entry[0] > now
+                }
+                while len(self._session_cache) >= _SESSION_CACHE_MAX:
+                    del self._session_cache[next(iter(self._session_cache))]
+            self._session_cache[session.session_id] = (now + ttl, user)
+    
+    def _drop_cached_session(self, session_id: str):
+        """Forget a cached session"""
+        with self._session_cache_lock:
+            self._session_cache.pop(session_id, None)
+    
+    def _drop_cached_user(self, user_id: str):
+        """Forget every cached session belonging to a user"""
+        with self._session_cache_lock:
+            stale = [sid for sid, (_, user) in self._session_cache.items()
+                     if user.user_id == user_id]
+            for sid in stale:
+                del self._session_cache[sid]
+    
     def get_current_user(self, session_id: str) -> Optional[User]:
         """Get current user from session"""
         try:
@@ -176,7 +254,10 @@ class AuthManager:
                 return False, "New password must be at least 6 characters long"
             
             user.set_password(new_password)
-            if self.db.update_user(user):
+            self._drop_cached_user(user_id)
+            updated = self.db.update_user(user)
+            self._drop_cached_user(user_id)
+            if updated:
                 return True, "Password changed successfully"
             else:
                 return False, "Failed to update password"
@@ -187,7 +268,10 @@ class AuthManager:
     def update_profile(self, user_id: str, profile_data: dict) -> Tuple[bool, str]:
         """Update user profile"""
         try:
-            if self.db.update_user_profile(user_id, profile_data):
+            self._drop_cached_user(user_id)
+            updated = self.db.update_user_profile(user_id, profile_data)
+            self._drop_cached_user(user_id)
+            if updated:
                 return True, "Profile updated successfully"
             else:
                 return False, "Failed to update profile"
@@ -197,19 +281,17 @@ class AuthManager:
     def get_user_stats(self, user_id: str) -> dict:
         """Get user statistics for dashboard"""
         try:
-            user = self.db.get_user_by_id(user_id)
+            user, active_sessions = self.db.get_user_with_session_count(user_id)
             if not user:
                 return {}
             
-            sessions = self.db.get_user_sessions(user_id)
-            
             return {
                 "user_id": user.user_id,
                 "username": user.username,
                 "email": user.email,
                 "created_at": user.created_at,
                 "last_login": user.last_login,
-                "active_sessions": len(sessions),
+                "active_sessions": active_sessions,
                 "profile": user.profile
             }
         except Exception:
@@ -222,19 +304,29 @@ class AuthManager:
     @staticmethod
     def _generate_user_id() -> str:
         """Generate a unique user ID"""
-        return f"user_{secrets.token_urlsafe(16)}"
+        with _id_pool_lock:
+            if not _id_pool:
+                _refill_id_pool()
+            return f"user_{_id_pool.popleft()}"
     
     def get_all_users(self) -> list:
         """Get all users (for admin purposes)"""
         return self.db.get_all_users()
     
+    def get_user_summaries(self) -> list:
+        """User summaries (user_id, username, is_active)"""
+        return self.db.get_user_summaries()
+    
     def deactivate_user(self, user_id: str) -> bool:
         """Deactivate a user account"""
         try:
             user = self.db.get_user_by_id(user_id)
             if user:
                 user.is_active = False
-                return self.db.update_user(user)
+                self._drop_cached_user(user_id)
+                updated = self.db.update_user(user)
+                self._drop_cached_user(user_id)
+                return updated
             return False
         except Exception:
             return False
@@ -249,3 +341,9 @@ class AuthManager:
             return False
         except Exception:
             return False
+
+
+@lru_cache(maxsize=1)
+def get_auth_manager() -> AuthManager:
+    """Shared AuthManager instance backed by the shared AuthDB"""
+    return AuthManager()
@@ -3,17 +3,70 @@ Database operations for authentication and user management
 """
 import json
 import os
-from typing import Optional, Dict, List
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from typing import Optional, Dict, List, Tuple
 from datetime import datetime
 from .models import User, UserSession, UserProfile
 
 
+try:
+    import orjson
+except ImportError:  # optional speedup; fall back to the stdlib encoder
+    orjson = None
+
+
+def _dumps(obj) -> str:
+    """Serialize a record for the data column"""
+    if orjson is not None:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj, default=str)
+
+
+def _loads(data) -> Dict:
+    """Parse a data column (or legacy JSON file) back into a dict"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _epoch(value: datetime) -> int:
+    """Unix seconds, so expiry checks are plain integer comparisons"""
+    return int(value.timestamp())
+
+
 class AuthDB:
-    """Simple file-based database for authentication data"""
+    """SQLite-backed database for authentication data"""
     
-    def __init__(self, data_dir: str = "data/auth"):
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id TEXT PRIMARY KEY,
+            username TEXT NOT NULL UNIQUE,
+            data TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS sessions (
+            session_id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            expires_at INTEGER NOT NULL,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS ix_sessions_user ON sessions(user_id);
+        CREATE INDEX IF NOT EXISTS ix_sessions_exp ON sessions(expires_at);
+    """
+    
+    def __init__(self, data_dir: str = "data/auth", db_name: str = "auth.db"):
         self.data_dir = data_dir
+        # Endpoints run in the threadpool; one connection shared under a lock
+        self._lock = threading.RLock()
         self.ensure_data_dir()
+        self._conn = sqlite3.connect(self._get_file_path(db_name), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+        self._import_legacy_json()
     
     def ensure_data_dir(self):
         """Create data directory if it doesn't exist"""
@@ -27,191 +80,206 @@ class AuthDB:
         """Load JSON data from file"""
         file_path = self._get_file_path(filename)
         if os.path.exists(file_path):
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            with open(file_path, 'rb') as f:
+                return _loads(f.read())
         return {}
     
-    def _save_json(self, filename: str, data: Dict):
-        """Save JSON data to file"""
-        file_path = self._get_file_path(filename)
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, default=str)
+    def _import_legacy_json(self):
+        """Copy users.json / sessions.json into empty tables from older installs"""
+        with self._lock, self._conn:
+            if self._conn.execute("SELECT 1 FROM users LIMIT 1").fetchone() is None:
+                for user_data in self._load_json("users.json").values():
+                    user = User(**user_data)
+                    self._conn.execute(
+                        "INSERT OR IGNORE INTO users (user_id, username, data) VALUES (?, ?, ?)",
+                        (user.user_id, user.username, user.model_dump_json())
+                    )
+            if self._conn.execute("SELECT 1 FROM sessions LIMIT 1").fetchone() is None:
+                for session_data in self._load_json("sessions.json").get("sessions", []):
+                    self._insert_session(UserSession(**session_data))
     
     # User Operations
     def create_user(self, user: User) -> bool:
         """Create a new user"""
         try:
-            data = self._load_json("users.json")
-            
-            # Check if username already exists
-            for existing_user in data.values():
-                if existing_user.get("username") == user.username:
-                    return False
-            
-            data[user.user_id] = user.dict()
-            self._save_json("users.json", data)
+            with self._lock, self._conn:
+                self._conn.execute(
+                    "INSERT INTO users (user_id, username, data) VALUES (?, ?, ?)",
+                    (user.user_id, user.username, user.model_dump_json())
+                )
             return True
-        except Exception:
+        except sqlite3.IntegrityError:
+            # Username (or id) already exists
             return False
     
     def get_user_by_id(self, user_id: str) -> Optional[User]:
         """Get user by user ID"""
-        try:
-            data = self._load_json("users.json")
-            if user_id in data:
-                return User(**data[user_id])
-            return None
-        except Exception:
-            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM users WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        if row:
+            return User.model_validate_json(row["data"])
+        return None
     
     def get_user_by_username(self, username: str) -> Optional[User]:
         """Get user by username"""
-        try:
-            data = self._load_json("users.json")
-            for user_data in data.values():
-                if user_data.get("username") == username:
-                    return User(**user_data)
-            return None
-        except Exception:
-            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM users WHERE username = ?", (username,)
+            ).fetchone()
+        if row:
+            return User.model_validate_json(row["data"])
+        return None
     
     def update_user(self, user: User) -> bool:
         """Update user data"""
-        try:
-            data = self._load_json("users.json")
-            if user.user_id in data:
-                data[user.user_id] = user.dict()
-                self._save_json("users.json", data)
-                return True
-            return False
-        except Exception:
-            return False
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "UPDATE users SET username = ?, data = ? WHERE user_id = ?",
+                (user.username, user.model_dump_json(), user.user_id)
+            )
+        return cur.rowcount > 0
+    
+    def update_last_login(self, user_id: str, last_login: datetime) -> bool:
+        """Set only the last_login field of a user"""
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT data FROM users WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            if not row:
+                return False
+            user_data = _loads(row["data"])
+            user_data["last_login"] = str(last_login)
+            self._conn.execute(
+                "UPDATE users SET data = ? WHERE user_id = ?",
+                (_dumps(user_data), user_id)
+            )
+        return True
     
     def get_all_users(self) -> List[User]:
         """Get all users (for admin purposes)"""
-        try:
-            data = self._load_json("users.json")
-            return [User(**user_data) for user_data in data.values()]
-        except Exception:
-            return []
+        with self._lock:
+            rows = self._conn.execute("SELECT data FROM users ORDER BY rowid").fetchall()
+        return [User.model_validate_json(row["data"]) for row in rows]
+    
+    def get_user_summaries(self) -> List[Dict]:
+        """Id, username and active flag per user, without parsing the user records"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT user_id, username, "
+                "COALESCE(json_extract(data, '$.is_active'), 1) AS is_active "
+                "FROM users ORDER BY rowid"
+            ).fetchall()
+        return [
+            {"user_id": row["user_id"], "username": row["username"],
+             "is_active": bool(row["is_active"])}
+            for row in rows
+        ]
     
     # Session Operations
+    def _insert_session(self, session: UserSession):
+        """Insert a session row; caller holds the lock and transaction"""
+        self._conn.execute(
+            "INSERT OR REPLACE INTO sessions (session_id, user_id, expires_at, data) "
+            "VALUES (?, ?, ?, ?)",
+            (session.session_id, session.user_id, _epoch(session.expires_at),
+             session.model_dump_json())
+        )
+    
     def create_session(self, session: UserSession) -> bool:
         """Create a new user session"""
-        try:
-            data = self._load_json("sessions.json")
-            if "sessions" not in data:
-                data["sessions"] = []
-            
-            data["sessions"].append(session.dict())
-            self._save_json("sessions.json", data)
-            return True
-        except Exception:
-            return False
+        with self._lock, self._conn:
+            self._insert_session(session)
+        return True
     
     def get_session(self, session_id: str) -> Optional[UserSession]:
         """Get session by session ID"""
-        try:
-            data = self._load_json("sessions.json")
-            if "sessions" in data:
-                for session_data in data["sessions"]:
-                    if session_data.get("session_id") == session_id:
-                        session = UserSession(**session_data)
-                        if not session.is_expired():
-                            return session
-                        else:
-                            # Remove expired session
-                            self.remove_session(session_id)
-            return None
-        except Exception:
-            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        if row:
+            session = UserSession.model_validate_json(row["data"])
+            # Expired rows are left for the periodic cleanup task
+            if not session.is_expired():
+                return session
+        return None
     
     def remove_session(self, session_id: str) -> bool:
         """Remove a session"""
-        try:
-            data = self._load_json("sessions.json")
-            if "sessions" in data:
-                data["sessions"] = [
-                    s for s in data["sessions"] 
-                    if s.get("session_id") != session_id
-                ]
-                self._save_json("sessions.json", data)
-            return True
-        except Exception:
-            return False
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+        return True
     
     def cleanup_expired_sessions(self):
         """Remove all expired sessions"""
-        try:
-            data = self._load_json("sessions.json")
-            if "sessions" in data:
-                current_time = datetime.now()
-                data["sessions"] = [
-                    s for s in data["sessions"]
-                    if datetime.fromisoformat(s.get("expires_at", "1970-01-01")) > current_time
-                ]
-                self._save_json("sessions.json", data)
-        except Exception:
-            pass
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM sessions WHERE expires_at <= ?", (int(time.time()),)
+            )
     
     def get_user_sessions(self, user_id: str) -> List[UserSession]:
         """Get all active sessions for a user"""
-        try:
-            data = self._load_json("sessions.json")
-            sessions = []
-            if "sessions" in data:
-                for session_data in data["sessions"]:
-                    if session_data.get("user_id") == user_id:
-                        session = UserSession(**session_data)
-                        if not session.is_expired():
-                            sessions.append(session)
-            return sessions
-        except Exception:
-            return []
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT data FROM sessions WHERE user_id = ? AND expires_at > ? ORDER BY rowid",
+                (user_id, int(time.time()))
+            ).fetchall()
+        return [UserSession.model_validate_json(row["data"]) for row in rows]
+    
+    def get_user_with_session_count(self, user_id: str) -> Tuple[Optional[User], int]:
+        """Get a user and their number of active sessions in one pass"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, (SELECT COUNT(*) FROM sessions "
+                "WHERE user_id = users.user_id AND expires_at >= ?) AS active "
+                "FROM users WHERE user_id = ?",
+                (int(time.time()), user_id)
+            ).fetchone()
+        if not row:
+            return None, 0
+        return User.model_validate_json(row["data"]), row["active"]
     
     # Profile Operations
     def get_user_profile(self, user_id: str) -> Optional[UserProfile]:
         """Get user profile for dashboard"""
-        try:
-            user = self.get_user_by_id(user_id)
-            if user:
-                return UserProfile(
-                    user_id=user.user_id,
-                    username=user.username,
-                    email=user.email,
-                    created_at=user.created_at,
-                    last_login=user.last_login,
-                    profile=user.profile
-                )
-            return None
-        except Exception:
-            return None
+        user = self.get_user_by_id(user_id)
+        if user:
+            return UserProfile(
+                user_id=user.user_id,
+                username=user.username,
+                email=user.email,
+                created_at=user.created_at,
+                last_login=user.last_login,
+                profile=user.profile
+            )
+        return None
     
     def update_user_profile(self, user_id: str, profile_data: Dict) -> bool:
         """Update user profile data"""
-        try:
+        with self._lock:
             user = self.get_user_by_id(user_id)
             if user:
                 user.profile.update(profile_data)
                 return self.update_user(user)
             return False
-        except Exception:
-            return False
     
     # Statistics
     def get_user_count(self) -> int:
         """Get total number of users"""
-        try:
-            data = self._load_json("users.json")
-            return len(data)
-        except Exception:
-            return 0
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
     
     def get_active_sessions_count(self) -> int:
         """Get number of active sessions"""
-        try:
-            self.cleanup_expired_sessions()
-            data = self._load_json("sessions.json")
-            return len(data.get("sessions", []))
-        except Exception:
-            return 0
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM sessions WHERE expires_at > ?", (int(time.time()),)
+            ).fetchone()[0]
+
+
+@lru_cache(maxsize=1)
+def get_auth_db() -> AuthDB:
+    """Shared AuthDB instance used by the auth manager and API"""
+    return AuthDB()
@@ -3,10 +3,20 @@ Authentication and user data models
 """
 from typing import Optional, Dict, Any
 from datetime import datetime
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 import hashlib
+import hmac
 import secrets
 
+# scrypt cost parameters (about 16 MiB of memory per hash)
+_SCRYPT_N = 2 ** 14
+_SCRYPT_R = 8
+_SCRYPT_P = 1
+_SCRYPT_MAXMEM = 64 * 2 ** 20
+
+# Static salt of the original SHA-256 scheme, kept to verify old hashes
+_LEGACY_SALT = "yoga_app_salt_2024"
+
 
 class User(BaseModel):
     """User model for authentication and profile data"""
@@ -14,7 +24,7 @@ class User(BaseModel):
     username: str
     email: Optional[str] = None
     password_hash: str = ""
-    created_at: datetime = datetime.now()
+    created_at: datetime = Field(default_factory=datetime.now)
     last_login: Optional[datetime] = None
     is_active: bool = True
     profile: Dict[str, Any] = {}
@@ -25,20 +35,39 @@ class User(BaseModel):
     
     def check_password(self, password: str) -> bool:
         """Check if password matches hash"""
-        return self.password_hash == self._hash_password(password)
+        if self.password_hash.startswith("scrypt$"):
+            _, salt_hex, _ = self.password_hash.split("$", 2)
+            expected = self._hash_password(password, bytes.fromhex(salt_hex))
+        else:
+            expected = self._legacy_hash_password(password)
+        return hmac.compare_digest(self.password_hash, expected)
+    
+    def needs_rehash(self) -> bool:
+        """True if the stored hash uses the old SHA-256 scheme"""
+        return not self.password_hash.startswith("scrypt$")
+    
+    @staticmethod
+    def _hash_password(password: str, salt: Optional[bytes] = None) -> str:
+        """Hash password with scrypt and a per-user salt, as scrypt$<salt>$<hash>"""
+        if salt is None:
+            salt = secrets.token_bytes(16)
+        digest = hashlib.scrypt(
+            password.encode(), salt=salt,
+            n=_SCRYPT_N, r=_SCRYPT_R, p=_SCRYPT_P, maxmem=_SCRYPT_MAXMEM
+        )
+        return f"scrypt${salt.hex()}${digest.hex()}"
     
     @staticmethod
-    def _hash_password(password: str) -> str:
-        """Hash password using SHA-256 with salt"""
-        salt = "yoga_app_salt_2024"  # In production, use random salt per user
-        return hashlib.sha256((password + salt).encode()).hexdigest()
+    def _legacy_hash_password(password: str) -> str:
+        """Hash password using SHA-256 with the old static salt"""
+        return hashlib.sha256((password + _LEGACY_SALT).encode()).hexdigest()
 
 
 class UserSession(BaseModel):
     """User session model for tracking active sessions"""
     session_id: str
     user_id: str
-    created_at: datetime = datetime.now()
+    created_at: datetime = Field(default_factory=datetime.now)
     expires_at: datetime
     ip_address: Optional[str] = None
     user_agent: Optional[str] = None
@@ -1,7 +1,10 @@
 """
 API endpoints for gamification features
 """
-from fastapi import APIRouter, HTTPException
+import hashlib
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 from typing import Dict, List, Optional
 from datetime import datetime
 from .models import UserProgress, PoseSession, Achievement, Leaderboard
@@ -14,154 +17,123 @@ router = APIRouter(prefix="/gamification", tags=["gamification"])
 db = GamificationDB()
 engine = GamificationEngine(db)
 
+# Client cache lifetimes (seconds) for the read-mostly endpoints
+ACHIEVEMENTS_MAX_AGE = 3600
+LEADERBOARD_MAX_AGE = 60
+DAILY_CHALLENGE_MAX_AGE = 60
+
+
+def _cacheable_response(request: Request, content, max_age: int) -> Response:
+    """JSON response with ETag and Cache-Control; 304 if the client's copy is current"""
+    response = JSONResponse(jsonable_encoder(content))
+    etag = f'W/"{hashlib.blake2b(response.body, digest_size=16).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": f"max-age={max_age}"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return response
+
 
 @router.get("/progress/{user_id}")
 async def get_user_progress(user_id: str) -> Dict:
     """Get user's progress and statistics"""
-    try:
-        # Ensure progress exists for this user; auto-create on first access
-        progress = db.get_user_progress(user_id)
-        if progress is None:
-            db.create_user_progress(user_id)
-        stats = engine.get_user_stats(user_id)
-        if not stats:
-            raise HTTPException(status_code=404, detail="User not found")
-        return stats
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    # Ensure progress exists for this user; auto-create on first access
+    progress = db.get_or_create_user_progress(user_id)
+    return engine.get_user_stats_from(progress)
 
 
 @router.post("/session")
 async def submit_session(session_data: Dict) -> Dict:
     """Submit a completed pose session"""
-    try:
-        user_id = session_data.get("user_id")
-        pose_name = session_data.get("pose_name")
-        duration = session_data.get("duration", 0)
-        accuracy = session_data.get("accuracy", 0.0)
-        feedback = session_data.get("feedback", {})
-        
-        if not user_id or not pose_name:
-            raise HTTPException(status_code=400, detail="Missing required fields")
-        
-        result = engine.process_session(user_id, pose_name, duration, accuracy, feedback)
-        return result
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-
-@router.get("/achievements")
-async def get_achievements() -> List[Achievement]:
+    user_id = session_data.get("user_id")
+    pose_name = session_data.get("pose_name")
+    duration = session_data.get("duration", 0)
+    accuracy = session_data.get("accuracy", 0.0)
+    feedback = session_data.get("feedback", {})
+    
+    if not user_id or not pose_name:
+        raise HTTPException(status_code=400, detail="Missing required fields")
+    
+    result = engine.process_session(user_id, pose_name, duration, accuracy, feedback)
+    return result
+
+
+@router.get("/achievements", response_model=List[Achievement])
+async def get_achievements(request: Request) -> Response:
     """Get all available achievements"""
-    try:
-        return db.get_achievements()
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    return _cacheable_response(request, db.get_achievements(), ACHIEVEMENTS_MAX_AGE)
 
 
 @router.get("/achievements/{user_id}")
 async def get_user_achievements(user_id: str) -> List[Dict]:
     """Get user's earned achievements"""
-    try:
-        achievements = db.get_user_achievements(user_id)
-        return [ach.dict() for ach in achievements]
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    achievements = db.get_user_achievements(user_id)
+    return [ach.model_dump() for ach in achievements]
 
 
-@router.get("/leaderboard")
-async def get_leaderboard(limit: int = 10) -> List[Leaderboard]:
+@router.get("/leaderboard", response_model=List[Leaderboard])
+async def get_leaderboard(request: Request, limit: int = 10) -> Response:
     """Get leaderboard"""
-    try:
-        return db.get_leaderboard(limit)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    return _cacheable_response(request, db.get_leaderboard(limit), LEADERBOARD_MAX_AGE)
 
 
-@router.get("/daily-challenge")
-async def get_daily_challenge() -> Optional[Dict]:
+@router.get("/daily-challenge", response_model=Optional[Dict])
+async def get_daily_challenge(request: Request) -> Response:
     """Get today's daily challenge"""
-    try:
-        challenge = db.get_today_challenge()
-        if challenge:
-            return challenge.dict()
-        return None
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    challenge = db.get_today_challenge()
+    content = challenge.model_dump() if challenge else None
+    return _cacheable_response(request, content, DAILY_CHALLENGE_MAX_AGE)
 
 
 @router.post("/daily-challenge/complete")
 async def complete_daily_challenge(completion_data: Dict) -> Dict:
     """Mark daily challenge as completed"""
-    try:
-        user_id = completion_data.get("user_id")
-        challenge_id = completion_data.get("challenge_id")
-        
-        if not user_id or not challenge_id:
-            raise HTTPException(status_code=400, detail="Missing required fields")
-        
-        # Get challenge
-        challenge = db.get_today_challenge()
-        if not challenge or challenge.challenge_id != challenge_id:
-            raise HTTPException(status_code=404, detail="Challenge not found")
-        
-        # Add user to completions if not already there
-        if user_id not in challenge.completions:
-            challenge.completions.append(user_id)
-            db.create_daily_challenge(challenge)
-            
-            # Award XP
-            progress = db.get_user_progress(user_id)
-            if progress:
-                progress.experience_points += challenge.reward_xp
-                db.save_user_progress(progress)
-        
-        return {"completed": True, "reward_xp": challenge.reward_xp}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    user_id = completion_data.get("user_id")
+    challenge_id = completion_data.get("challenge_id")
+    
+    if not user_id or not challenge_id:
+        raise HTTPException(status_code=400, detail="Missing required fields")
+    
+    # Add user to completions and award XP, if not already completed
+    challenge, _ = db.complete_daily_challenge(user_id, challenge_id)
+    if not challenge:
+        raise HTTPException(status_code=404, detail="Challenge not found")
+    
+    return {"completed": True, "reward_xp": challenge.reward_xp}
 
 
 @router.get("/sessions/{user_id}")
 async def get_user_sessions(user_id: str, limit: int = 50) -> List[Dict]:
     """Get user's recent sessions"""
-    try:
-        sessions = db.get_user_sessions(user_id, limit)
-        return [session.dict() for session in sessions]
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    sessions = db.get_user_sessions(user_id, limit)
+    return [session.model_dump() for session in sessions]
 
 
 @router.post("/user/create")
 async def create_user(user_data: Dict) -> Dict:
     """Create a new user"""
-    try:
-        user_id = user_data.get("user_id")
-        if not user_id:
-            raise HTTPException(status_code=400, detail="user_id is required")
-        
-        # Check if user already exists
-        existing = db.get_user_progress(user_id)
-        if existing:
-            raise HTTPException(status_code=409, detail="User already exists")
-        
-        # Create new user
-        progress = db.create_user_progress(user_id)
-        return {"user_id": user_id, "created": True}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    user_id = user_data.get("user_id")
+    if not user_id:
+        raise HTTPException(status_code=400, detail="user_id is required")
+    
+    # Check if user already exists
+    existing = db.get_user_progress(user_id)
+    if existing:
+        raise HTTPException(status_code=409, detail="User already exists")
+    
+    # Create new user
+    progress = db.create_user_progress(user_id)
+    return {"user_id": user_id, "created": True}
 
 
 @router.get("/stats/global")
 async def get_global_stats() -> Dict:
     """Get global statistics"""
-    try:
-        # This would require aggregating data from all users
-        # For now, return basic stats
-        return {
-            "total_users": 0,  # Would need to count users
-            "total_sessions": 0,  # Would need to count all sessions
-            "active_users_today": 0,  # Would need to count users who practiced today
-            "most_popular_pose": "Unknown"  # Would need to analyze all sessions
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    # This would require aggregating data from all users
+    # For now, return basic stats
+    return {
+        "total_users": 0,  # Would need to count users
+        "total_sessions": 0,  # Would need to count all sessions
+        "active_users_today": 0,  # Would need to count users who practiced today
+        "most_popular_pose": "Unknown"  # Would need to analyze all sessions
+    }
@@ -3,7 +3,9 @@ Database operations for gamification features
 """
 import json
 import os
-from typing import Dict, List, Optional
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Set, Tuple
 from datetime import datetime, date, timedelta
 from .models import (
     UserProgress, PoseSession, Achievement, UserAchievement, 
@@ -11,12 +13,78 @@ from .models import (
 )
 
 
+try:
+    import orjson
+except ImportError:  # optional speedup; fall back to the stdlib encoder
+    orjson = None
+
+
+def _dumps(obj) -> str:
+    """Serialize a record for the data column"""
+    if orjson is not None:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj, default=str)
+
+
+def _loads(data) -> Dict:
+    """Parse a data column (or legacy JSON file) back into a dict"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
 class GamificationDB:
-    """Simple file-based database for gamification data"""
+    """SQLite-backed database for gamification data"""
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS user_progress (
+            user_id TEXT PRIMARY KEY,
+            experience_points INTEGER NOT NULL DEFAULT 0,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS ix_progress_xp ON user_progress(experience_points DESC);
+        CREATE TABLE IF NOT EXISTS pose_sessions (
+            session_id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            start_time TEXT NOT NULL,
+            pose_name TEXT NOT NULL DEFAULT '',
+            duration INTEGER NOT NULL DEFAULT 0,
+            accuracy_score REAL NOT NULL DEFAULT 0,
+            data TEXT NOT NULL
+        );
+        -- Covers the per-user stats query: newest-first scan, no table lookups
+        CREATE INDEX IF NOT EXISTS ix_pose_sessions_user_time
+            ON pose_sessions(user_id, start_time DESC, pose_name, duration, accuracy_score);
+        CREATE TABLE IF NOT EXISTS achievements (
+            achievement_id TEXT PRIMARY KEY,
+            data TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS user_achievements (
+            user_id TEXT NOT NULL,
+            achievement_id TEXT NOT NULL,
+            data TEXT NOT NULL,
+            PRIMARY KEY (user_id, achievement_id)
+        );
+        CREATE TABLE IF NOT EXISTS daily_challenges (
+            date TEXT PRIMARY KEY,
+            data TEXT NOT NULL
+        );
+    """
     
-    def __init__(self, data_dir: str = "data/gamification"):
+    def __init__(self, data_dir: str = "data/gamification", db_name: str = "gamification.db"):
         self.data_dir = data_dir
+        # One connection shared by request threads; the lock keeps statements
+        # and transactions from interleaving
+        self._lock = threading.RLock()
+        # Achievement definitions never change at runtime; loaded on first use
+        self._achievements: Optional[List[Achievement]] = None
         self.ensure_data_dir()
+        self._conn = sqlite3.connect(self._get_file_path(db_name), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+        self._import_legacy_json()
     
     def ensure_data_dir(self):
         """Create data directory if it doesn't exist"""
@@ -30,30 +98,85 @@ class GamificationDB:
         """Load JSON data from file"""
         file_path = self._get_file_path(filename)
         if os.path.exists(file_path):
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            with open(file_path, 'rb') as f:
+                return _loads(f.read())
         return {}
     
-    def _save_json(self, filename: str, data: Dict):
-        """Save JSON data to file"""
-        file_path = self._get_file_path(filename)
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, default=str)
+    def _is_empty(self, table: str) -> bool:
+        return self._conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone() is None
+    
+    def _import_legacy_json(self):
+        """Copy the JSON files of older installs into empty tables"""
+        with self._lock, self._conn:
+            if self._is_empty("user_progress"):
+                for progress_data in self._load_json("user_progress.json").values():
+                    self._write_progress(UserProgress(**progress_data))
+            if self._is_empty("pose_sessions"):
+                for session_data in self._load_json("pose_sessions.json").get("sessions", []):
+                    self._write_session(PoseSession(**session_data))
+            if self._is_empty("achievements"):
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO achievements (achievement_id, data) VALUES (?, ?)",
+                    [(ach["achievement_id"], _dumps(ach))
+                     for ach in self._load_json("achievements.json").get("achievements", [])]
+                )
+            if self._is_empty("user_achievements"):
+                for ach_list in self._load_json("user_achievements.json").values():
+                    for ach_data in ach_list:
+                        self._write_user_achievement(UserAchievement(**ach_data))
+            if self._is_empty("daily_challenges"):
+                for challenge_data in self._load_json("daily_challenges.json").values():
+                    self._write_challenge(DailyChallenge(**challenge_data))
+    
+    # Row writers; callers hold the lock and an open transaction
+    def _write_progress(self, progress: UserProgress):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO user_progress (user_id, experience_points, data) "
+            "VALUES (?, ?, ?)",
+            (progress.user_id, progress.experience_points,
+             progress.model_dump_json())
+        )
+    
+    def _write_session(self, session: PoseSession):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO pose_sessions "
+            "(session_id, user_id, start_time, pose_name, duration, accuracy_score, data) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (session.session_id, session.user_id, session.start_time.isoformat(),
+             session.pose_name, session.duration, session.accuracy_score,
+             session.model_dump_json())
+        )
+    
+    def _write_user_achievement(self, user_achievement: UserAchievement):
+        self._conn.execute(
+            "INSERT OR IGNORE INTO user_achievements (user_id, achievement_id, data) "
+            "VALUES (?, ?, ?)",
+            (user_achievement.user_id, user_achievement.achievement_id,
+             user_achievement.model_dump_json())
+        )
+    
+    def _write_challenge(self, challenge: DailyChallenge):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO daily_challenges (date, data) VALUES (?, ?)",
+            (challenge.date.isoformat(), challenge.model_dump_json())
+        )
     
     # User Progress Operations
     def get_user_progress(self, user_id: str) -> Optional[UserProgress]:
         """Get user progress data"""
-        data = self._load_json("user_progress.json")
-        if user_id in data:
-            return UserProgress(**data[user_id])
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM user_progress WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        if row:
+            return UserProgress.model_validate_json(row["data"])
         return None
     
     def save_user_progress(self, progress: UserProgress):
         """Save user progress data"""
-        data = self._load_json("user_progress.json")
         progress.updated_at = datetime.now()
-        data[progress.user_id] = progress.dict()
-        self._save_json("user_progress.json", data)
+        with self._lock, self._conn:
+            self._write_progress(progress)
     
     def create_user_progress(self, user_id: str) -> UserProgress:
         """Create new user progress"""
@@ -61,103 +184,232 @@ class GamificationDB:
         self.save_user_progress(progress)
         return progress
     
+    def get_or_create_user_progress(self, user_id: str) -> UserProgress:
+        """Get user progress, creating it in the same transaction if missing"""
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT data FROM user_progress WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            if row:
+                return UserProgress.model_validate_json(row["data"])
+            progress = UserProgress(user_id=user_id)
+            self._write_progress(progress)
+        return progress
+    
     # Pose Session Operations
     def save_pose_session(self, session: PoseSession):
         """Save pose session data"""
-        data = self._load_json("pose_sessions.json")
-        if "sessions" not in data:
-            data["sessions"] = []
-        data["sessions"].append(session.dict())
-        self._save_json("pose_sessions.json", data)
+        with self._lock, self._conn:
+            self._write_session(session)
     
     def get_user_sessions(self, user_id: str, limit: int = 50) -> List[PoseSession]:
         """Get user's recent sessions"""
-        data = self._load_json("pose_sessions.json")
-        sessions = []
-        if "sessions" in data:
-            for session_data in data["sessions"][-limit:]:
-                if session_data.get("user_id") == user_id:
-                    sessions.append(PoseSession(**session_data))
-        return sessions
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT data FROM pose_sessions WHERE user_id = ? "
+                "ORDER BY start_time DESC LIMIT ?",
+                (user_id, limit)
+            ).fetchall()
+        # Oldest first, as callers expect
+        return [PoseSession.model_validate_json(row["data"]) for row in reversed(rows)]
+    
+    def get_session_stats(self, user_id: str, since: datetime, limit: int = 100) -> Dict:
+        """Aggregate a user's last `limit` sessions in one query
+        
+        Returns session count, average accuracy, favorite pose (ties go to the
+        pose practised first) and the count, seconds and distinct poses of the
+        sessions that started at or after `since`.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                """
+                WITH recent AS (
+                    SELECT rowid AS seq, start_time, pose_name, duration, accuracy_score
+                    FROM pose_sessions WHERE user_id = ?
+                    ORDER BY start_time DESC LIMIT ?
+                ),
+                weekly AS (SELECT * FROM recent WHERE start_time >= ?)
+                SELECT
+                    (SELECT COUNT(*) FROM recent) AS total_sessions,
+                    (SELECT AVG(accuracy_score) FROM recent) AS average_accuracy,
+                    (SELECT pose_name FROM recent GROUP BY pose_name
+                     ORDER BY COUNT(*) DESC, MIN(seq) LIMIT 1) AS favorite_pose,
+                    (SELECT COUNT(*) FROM weekly) AS sessions_this_week,
+                    (SELECT COALESCE(SUM(duration), 0) FROM weekly) AS seconds_this_week,
+                    (SELECT COUNT(DISTINCT pose_name) FROM weekly) AS poses_this_week
+                """,
+                (user_id, limit, since.isoformat())
+            ).fetchone()
+        return dict(row)
     
     # Achievement Operations
     def get_achievements(self) -> List[Achievement]:
         """Get all available achievements"""
-        data = self._load_json("achievements.json")
-        if "achievements" not in data:
-            # Initialize default achievements
-            self._initialize_default_achievements()
-            data = self._load_json("achievements.json")
+        with self._lock:
+            if self._achievements is None:
+                rows = self._conn.execute("SELECT data FROM achievements ORDER BY rowid").fetchall()
+                if not rows:
+                    # Initialize default achievements
+                    self._initialize_default_achievements()
+                    rows = self._conn.execute("SELECT data FROM achievements ORDER BY rowid").fetchall()
+                self._achievements = [Achievement.model_validate_json(row["data"]) for row in rows]
         
-        return [Achievement(**ach) for ach in data["achievements"]]
+        return list(self._achievements)
     
     def get_user_achievements(self, user_id: str) -> List[UserAchievement]:
         """Get user's earned achievements"""
-        data = self._load_json("user_achievements.json")
-        achievements = []
-        if user_id in data:
-            for ach_data in data[user_id]:
-                achievements.append(UserAchievement(**ach_data))
-        return achievements
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT data FROM user_achievements WHERE user_id = ? ORDER BY rowid", (user_id,)
+            ).fetchall()
+        return [UserAchievement.model_validate_json(row["data"]) for row in rows]
     
     def award_achievement(self, user_id: str, achievement_id: str):
         """Award achievement to user"""
-        data = self._load_json("user_achievements.json")
-        if user_id not in data:
-            data[user_id] = []
-        
-        # Check if already awarded
-        for ach in data[user_id]:
-            if ach["achievement_id"] == achievement_id:
-                return  # Already awarded
-        
-        # Award achievement
         user_achievement = UserAchievement(
             user_id=user_id,
             achievement_id=achievement_id,
             earned_at=datetime.now()
         )
-        data[user_id].append(user_achievement.dict())
-        self._save_json("user_achievements.json", data)
+        # The (user_id, achievement_id) key makes repeat awards a no-op
+        with self._lock, self._conn:
+            self._write_user_achievement(user_achievement)
+    
+    def award_achievements(self, user_id: str, achievement_ids: List[str]) -> List[str]:
+        """Award several achievements to a user in one transaction
+
+        Returns the ids that were newly inserted; ones the user already had are skipped.
+        """
+        if not achievement_ids:
+            return []
+        earned_at = datetime.now()
+        rows = [
+            (user_id, achievement_id,
+             UserAchievement(user_id=user_id, achievement_id=achievement_id,
+                             earned_at=earned_at).model_dump_json())
+            for achievement_id in achievement_ids
+        ]
+        awarded = []
+        with self._lock, self._conn:
+            for row in rows:
+                cur = self._conn.execute(
+                    "INSERT OR IGNORE INTO user_achievements (user_id, achievement_id, data) "
+                    "VALUES (?, ?, ?)",
+                    row
+                )
+                if cur.rowcount:
+                    awarded.append(row[1])
+        return awarded
+    
+    def get_user_achievement_ids(self, user_id: str) -> Set[str]:
+        """Get the ids of a user's earned achievements without loading the records"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT achievement_id FROM user_achievements WHERE user_id = ?", (user_id,)
+            ).fetchall()
+        return {row["achievement_id"] for row in rows}
     
     # Daily Challenge Operations
     def get_today_challenge(self) -> Optional[DailyChallenge]:
         """Get today's daily challenge"""
-        data = self._load_json("daily_challenges.json")
         today = date.today().isoformat()
-        if today in data:
-            return DailyChallenge(**data[today])
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM daily_challenges WHERE date = ?", (today,)
+            ).fetchone()
+        if row:
+            return DailyChallenge.model_validate_json(row["data"])
         return None
     
     def create_daily_challenge(self, challenge: DailyChallenge):
         """Create daily challenge"""
-        data = self._load_json("daily_challenges.json")
-        data[challenge.date.isoformat()] = challenge.dict()
-        self._save_json("daily_challenges.json", data)
+        with self._lock, self._conn:
+            self._write_challenge(challenge)
+    
+    def complete_daily_challenge(self, user_id: str,
+                                 challenge_id: str) -> Tuple[Optional[DailyChallenge], bool]:
+        """Record a completion of today's challenge and award its XP in one transaction
+        
+        Returns (challenge, newly_completed); challenge is None when challenge_id
+        is not today's challenge.
+        """
+        today = date.today().isoformat()
+        with self._lock, self._conn:
+            # Append the user to completions only if this is today's challenge
+            # and they are not already in it; no row back means nothing changed
+            row = self._conn.execute(
+                "UPDATE daily_challenges "
+                "SET data = json_insert(data, '$.completions[#]', ?) "
+                "WHERE date = ? AND json_extract(data, '$.challenge_id') = ? "
+                "AND NOT EXISTS (SELECT 1 FROM json_each(data, '$.completions') "
+                "WHERE value = ?) "
+                "RETURNING data",
+                (user_id, today, challenge_id, user_id)
+            ).fetchone()
+            if not row:
+                row = self._conn.execute(
+                    "SELECT data FROM daily_challenges "
+                    "WHERE date = ? AND json_extract(data, '$.challenge_id') = ?",
+                    (today, challenge_id)
+                ).fetchone()
+                if not row:
+                    return None, False
+                return DailyChallenge.model_validate_json(row["data"]), False
+            challenge = DailyChallenge.model_validate_json(row["data"])
+            
+            # Award XP; the right-hand side sees the pre-update experience_points
+            self._conn.execute(
+                "UPDATE user_progress SET experience_points = experience_points + ?, "
+                "data = json_set(data, '$.experience_points', experience_points + ?, "
+                "'$.updated_at', ?) "
+                "WHERE user_id = ?",
+                (challenge.reward_xp, challenge.reward_xp, datetime.now().isoformat(), user_id)
+            )
+        return challenge, True
     
     # Leaderboard Operations
     def get_leaderboard(self, limit: int = 10) -> List[Leaderboard]:
         """Get leaderboard"""
-        data = self._load_json("user_progress.json")
-        leaderboard = []
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT user_id, data FROM user_progress "
+                "ORDER BY experience_points DESC, rowid LIMIT ?",
+                (limit,)
+            ).fetchall()
         
-        for user_id, progress_data in data.items():
-            progress = UserProgress(**progress_data)
+        leaderboard = []
+        for rank, row in enumerate(rows, start=1):
+            progress = UserProgress.model_validate_json(row["data"])
             leaderboard.append(Leaderboard(
-                user_id=user_id,
-                username=user_id,  # Default to user_id, can be enhanced
+                user_id=row["user_id"],
+                username=row["user_id"],  # Default to user_id, can be enhanced
                 total_xp=progress.experience_points,
                 level=progress.level,
                 current_streak=progress.current_streak,
-                rank=0  # Will be calculated
+                rank=rank
             ))
         
-        # Sort by XP and assign ranks
-        leaderboard.sort(key=lambda x: x.total_xp, reverse=True)
-        for i, entry in enumerate(leaderboard[:limit]):
-            entry.rank = i + 1
-        
-        return leaderboard[:limit]
+        return leaderboard
+    
+    def get_user_rank(self, user_id: str) -> Optional[int]:
+        """Get a user's leaderboard position, using the same ordering as get_leaderboard"""
+        with self._lock:
+            me = self._conn.execute(
+                "SELECT experience_points, rowid FROM user_progress WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            if not me:
+                return None
+            ahead = self._conn.execute(
+                "SELECT COUNT(*) FROM user_progress WHERE experience_points > ? "
+                "OR (experience_points = ? AND rowid < ?)",
+                (me[0], me[0], me[1])
+            ).fetchone()[0]
+        return ahead + 1
+    
+    def get_total_users(self) -> int:
+        """Get number of users with progress records"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM user_progress").fetchone()[0]
     
     def _initialize_default_achievements(self):
         """Initialize default achievements"""
@@ -200,5 +452,8 @@ class GamificationDB:
             }
         ]
         
-        data = {"achievements": achievements}
-        self._save_json("achievements.json", data)
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO achievements (achievement_id, data) VALUES (?, ?)",
+                [(ach["achievement_id"], _dumps(ach)) for ach in achievements]
+            )
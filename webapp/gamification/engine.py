@@ -1,18 +1,40 @@
 """
 Gamification engine for calculating progress, achievements, and rewards
 """
-from typing import Dict, List, Optional
+import bisect
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
 from datetime import datetime, date, timedelta
 from .models import UserProgress, PoseSession, Achievement, UserAchievement
 from .database import GamificationDB
 
 
+# Achievement requirement name -> progress value it is measured against
+_REQUIREMENT_GETTERS = {
+    "sessions": lambda progress: progress.total_sessions,
+    "streak": lambda progress: progress.current_streak,
+    "poses_learned": lambda progress: len(progress.poses_learned),
+    "total_time": lambda progress: progress.total_practice_time,
+}
+
+# Users whose earned achievement ids the engine keeps in memory
+_EARNED_CACHE_MAX = 10000
+
+
 class GamificationEngine:
     """Main gamification logic engine"""
     
     def __init__(self, db: GamificationDB):
         self.db = db
         self.levels = self._initialize_levels()
+        # Achievements grouped for threshold checks; built on first use
+        self._achievement_buckets = None
+        # Earned achievement ids of recently active users, least recent first.
+        # Achievements are never revoked, so an entry only grows
+        self._earned_ids: "OrderedDict[str, Set[str]]" = OrderedDict()
+        # Parallel ascending arrays for bisecting XP into a level
+        self._level_numbers = sorted(self.levels)
+        self._level_xp_thresholds = [self.levels[level]["required_xp"] for level in self._level_numbers]
     
     def _initialize_levels(self) -> Dict[int, Dict]:
         """Initialize level system"""
@@ -33,17 +55,19 @@ class GamificationEngine:
                        accuracy: float, feedback: Dict[str, int]) -> Dict:
         """Process a completed pose session and update progress"""
         # Get or create user progress
-        progress = self.db.get_user_progress(user_id)
-        if not progress:
-            progress = self.db.create_user_progress(user_id)
+        progress = self.db.get_or_create_user_progress(user_id)
+        
+        # One clock read for the whole session so id, times and dates agree
+        now = datetime.now()
+        today = now.date()
         
         # Create session record
         session = PoseSession(
-            session_id=f"{user_id}_{datetime.now().timestamp()}",
+            session_id=f"{user_id}_{now.timestamp()}",
             user_id=user_id,
             pose_name=pose_name,
-            start_time=datetime.now() - timedelta(seconds=duration),
-            end_time=datetime.now(),
+            start_time=now - timedelta(seconds=duration),
+            end_time=now,
             duration=duration,
             accuracy_score=accuracy,
             attempts=feedback.get("total", 1),
@@ -54,15 +78,16 @@ class GamificationEngine:
         # Save session
         self.db.save_pose_session(session)
         
-        # Update progress
+        # Update progress; decide "new pose" before the pose is recorded
         old_level = progress.level
-        progress = self._update_progress(progress, session)
+        is_new_pose = pose_name not in progress.poses_learned
+        progress = self._update_progress(progress, session, today)
         
         # Check for achievements
         new_achievements = self._check_achievements(progress)
         
         # Calculate XP gained
-        xp_gained = self._calculate_xp(session, progress)
+        xp_gained = self._calculate_xp(session, progress, is_new_pose)
         progress.experience_points += xp_gained
         
         # Check level up
@@ -72,7 +97,7 @@ class GamificationEngine:
             progress.level = new_level
         
         # Update streak
-        self._update_streak(progress)
+        self._update_streak(progress, today)
         
         # Save updated progress
         self.db.save_user_progress(progress)
@@ -85,19 +110,20 @@ class GamificationEngine:
             "total_xp": progress.experience_points
         }
     
-    def _update_progress(self, progress: UserProgress, session: PoseSession) -> UserProgress:
+    def _update_progress(self, progress: UserProgress, session: PoseSession,
+                         today: Optional[date] = None) -> UserProgress:
         """Update user progress based on session"""
         progress.total_sessions += 1
         progress.total_practice_time += session.duration // 60  # Convert to minutes
         
-        # Add pose to learned poses if not already there
-        if session.pose_name not in progress.poses_learned:
-            progress.poses_learned.append(session.pose_name)
+        # Add pose to learned poses (a set, so repeats are no-ops)
+        progress.poses_learned.add(session.pose_name)
         
-        progress.last_practice_date = date.today()
+        progress.last_practice_date = today or date.today()
         return progress
     
-    def _calculate_xp(self, session: PoseSession, progress: UserProgress) -> int:
+    def _calculate_xp(self, session: PoseSession, progress: UserProgress,
+                      is_new_pose: bool) -> int:
         """Calculate XP gained from session"""
         base_xp = 10
         
@@ -111,21 +137,19 @@ class GamificationEngine:
         streak_bonus = min(progress.current_streak * 2, 20)
         
         # New pose bonus
-        new_pose_bonus = 25 if session.pose_name not in progress.poses_learned else 0
+        new_pose_bonus = 25 if is_new_pose else 0
         
         total_xp = base_xp + duration_bonus + accuracy_bonus + streak_bonus + new_pose_bonus
         return total_xp
     
     def _calculate_level(self, total_xp: int) -> int:
         """Calculate user level based on total XP"""
-        for level, data in reversed(self.levels.items()):
-            if total_xp >= data["required_xp"]:
-                return level
-        return 1
+        index = bisect.bisect_right(self._level_xp_thresholds, total_xp) - 1
+        return self._level_numbers[index] if index >= 0 else 1
     
-    def _update_streak(self, progress: UserProgress):
+    def _update_streak(self, progress: UserProgress, today: Optional[date] = None):
         """Update user's practice streak"""
-        today = date.today()
+        today = today or date.today()
         
         if progress.last_practice_date:
             days_diff = (today - progress.last_practice_date).days
@@ -147,100 +171,122 @@ class GamificationEngine:
         if progress.current_streak > progress.longest_streak:
             progress.longest_streak = progress.current_streak
     
+    def _get_achievement_buckets(self):
+        """Bucket single-requirement achievements by requirement, sorted by threshold
+        
+        Entries are (threshold, definition index, achievement_id); achievements
+        with several (or no known) requirements are returned separately.
+        """
+        if self._achievement_buckets is None:
+            buckets: Dict[str, List[Tuple[int, int, str]]] = {}
+            others: List[Tuple[int, Achievement]] = []
+            for index, achievement in enumerate(self.db.get_achievements()):
+                known = [(name, value) for name, value in achievement.requirements.items()
+                         if name in _REQUIREMENT_GETTERS]
+                if len(known) == 1:
+                    name, threshold = known[0]
+                    buckets.setdefault(name, []).append((threshold, index, achievement.achievement_id))
+                else:
+                    others.append((index, achievement))
+            for bucket in buckets.values():
+                bucket.sort()
+            self._achievement_buckets = (buckets, others)
+        return self._achievement_buckets
+    
     def _check_achievements(self, progress: UserProgress) -> List[str]:
         """Check and award new achievements"""
-        achievements = self.db.get_achievements()
-        user_achievements = self.db.get_user_achievements(progress.user_id)
-        earned_achievement_ids = {ach.achievement_id for ach in user_achievements}
+        buckets, others = self._get_achievement_buckets()
         
-        new_achievements = []
-        
-        for achievement in achievements:
-            if achievement.achievement_id in earned_achievement_ids:
-                continue  # Already earned
-            
-            # Check if requirements are met
+        # Collect (definition index, id) of every achievement whose requirements are met
+        candidates = []
+        for requirement, bucket in buckets.items():
+            current = _REQUIREMENT_GETTERS[requirement](progress)
+            for threshold, index, achievement_id in bucket:
+                if threshold > current:
+                    break  # Sorted, so the rest are out of reach too
+                candidates.append((index, achievement_id))
+        for index, achievement in others:
             if self._check_achievement_requirements(achievement, progress):
-                self.db.award_achievement(progress.user_id, achievement.achievement_id)
-                new_achievements.append(achievement.achievement_id)
+                candidates.append((index, achievement.achievement_id))
         
-        return new_achievements
+        if not candidates:
+            return []
+        
+        earned_achievement_ids = self._get_earned_ids(progress.user_id)
+        new_achievements = [
+            achievement_id for _, achievement_id in sorted(candidates)
+            if achievement_id not in earned_achievement_ids
+        ]
+        if not new_achievements:
+            return []
+        
+        # One write for everything earned in this session. Another engine on the
+        # same database may have awarded some already; the insert skips those
+        awarded = self.db.award_achievements(progress.user_id, new_achievements)
+        # Only now are they all stored, inserted here or by that other engine
+        earned_achievement_ids.update(new_achievements)
+        return awarded
+    
+    def _get_earned_ids(self, user_id: str) -> Set[str]:
+        """Cached earned achievement ids for a user, loaded from the DB on a miss"""
+        earned = self._earned_ids.get(user_id)
+        if earned is not None:
+            self._earned_ids.move_to_end(user_id)
+            return earned
+        earned = self.db.get_user_achievement_ids(user_id)
+        self._earned_ids[user_id] = earned
+        if len(self._earned_ids) > _EARNED_CACHE_MAX:
+            self._earned_ids.popitem(last=False)
+        return earned
     
     def _check_achievement_requirements(self, achievement: Achievement, 
                                       progress: UserProgress) -> bool:
         """Check if user meets achievement requirements"""
-        for requirement, target_value in achievement.requirements.items():
-            if requirement == "sessions":
-                if progress.total_sessions < target_value:
-                    return False
-            elif requirement == "streak":
-                if progress.current_streak < target_value:
-                    return False
-            elif requirement == "poses_learned":
-                if len(progress.poses_learned) < target_value:
-                    return False
-            elif requirement == "total_time":
-                if progress.total_practice_time < target_value:
-                    return False
-        
-        return True
+        # Unknown requirement names are ignored, as before
+        return all(
+            _REQUIREMENT_GETTERS[requirement](progress) >= target_value
+            for requirement, target_value in achievement.requirements.items()
+            if requirement in _REQUIREMENT_GETTERS
+        )
     
     def get_user_stats(self, user_id: str) -> Dict:
         """Get comprehensive user statistics"""
         progress = self.db.get_user_progress(user_id)
         if not progress:
             return {}
-        
-        sessions = self.db.get_user_sessions(user_id, limit=100)
+        return self.get_user_stats_from(progress)
+    
+    def get_user_stats_from(self, progress: UserProgress) -> Dict:
+        """Get comprehensive statistics for an already loaded progress record"""
+        user_id = progress.user_id
+        # Session aggregates are computed by the database over the last 100 sessions
+        session_stats = self.db.get_session_stats(
+            user_id, since=datetime.now() - timedelta(days=7), limit=100
+        )
         achievements = self.db.get_achievements()
         user_achievements = self.db.get_user_achievements(user_id)
         
-        # Calculate additional stats
-        total_accuracy = sum(s.accuracy_score for s in sessions) / len(sessions) if sessions else 0
-        favorite_pose = self._get_favorite_pose(sessions)
-        weekly_stats = self._get_weekly_stats(sessions)
-        
         return {
-            "progress": progress.dict(),
-            "total_sessions": len(sessions),
-            "average_accuracy": round(total_accuracy, 2),
-            "favorite_pose": favorite_pose,
-            "weekly_stats": weekly_stats,
-            "achievements": [ach.dict() for ach in user_achievements],
+            "progress": progress.model_dump(),
+            "total_sessions": session_stats["total_sessions"],
+            "average_accuracy": round(session_stats["average_accuracy"] or 0, 2),
+            "favorite_pose": session_stats["favorite_pose"],
+            "weekly_stats": {
+                "sessions_this_week": session_stats["sessions_this_week"],
+                "time_this_week": session_stats["seconds_this_week"] // 60,
+                "poses_this_week": session_stats["poses_this_week"]
+            },
+            "achievements": [ach.model_dump() for ach in user_achievements],
             "available_achievements": len(achievements),
             "level_info": self.levels.get(progress.level, {}),
             "next_level_xp": self._get_next_level_xp(progress.experience_points)
         }
     
-    def _get_favorite_pose(self, sessions: List[PoseSession]) -> Optional[str]:
-        """Get user's most practiced pose"""
-        if not sessions:
-            return None
-        
-        pose_counts = {}
-        for session in sessions:
-            pose_counts[session.pose_name] = pose_counts.get(session.pose_name, 0) + 1
-        
-        return max(pose_counts.items(), key=lambda x: x[1])[0]
-    
-    def _get_weekly_stats(self, sessions: List[PoseSession]) -> Dict:
-        """Get weekly practice statistics"""
-        now = datetime.now()
-        week_start = now - timedelta(days=7)
-        
-        weekly_sessions = [s for s in sessions if s.start_time >= week_start]
-        
-        return {
-            "sessions_this_week": len(weekly_sessions),
-            "time_this_week": sum(s.duration for s in weekly_sessions) // 60,
-            "poses_this_week": len(set(s.pose_name for s in weekly_sessions))
-        }
-    
     def _get_next_level_xp(self, current_xp: int) -> Optional[int]:
         """Get XP required for next level"""
-        current_level = self._calculate_level(current_xp)
-        next_level = current_level + 1
+        # Position of the first threshold above current_xp (never below level 2)
+        index = max(bisect.bisect_right(self._level_xp_thresholds, current_xp), 1)
         
-        if next_level in self.levels:
-            return self.levels[next_level]["required_xp"] - current_xp
+        if index < len(self._level_xp_thresholds):
+            return self._level_xp_thresholds[index] - current_xp
         return None
@@ -1,6 +1,7 @@
 """
 Integration helpers for connecting gamification with the main app
 """
+from functools import lru_cache
 from typing import Dict, Optional
 from datetime import datetime
 from .database import GamificationDB
@@ -96,25 +97,17 @@ class GamificationIntegration:
     def complete_daily_challenge(self, user_id: str, challenge_id: str) -> bool:
         """Mark daily challenge as completed for user"""
         try:
-            challenge = self.db.get_today_challenge()
-            if challenge and challenge.challenge_id == challenge_id:
-                if user_id not in challenge.completions:
-                    challenge.completions.append(user_id)
-                    self.db.create_daily_challenge(challenge)
-                    
-                    # Award XP
-                    progress = self.db.get_user_progress(user_id)
-                    if progress:
-                        progress.experience_points += challenge.reward_xp
-                        self.db.save_user_progress(progress)
-                    return True
+            _, completed = self.db.complete_daily_challenge(user_id, challenge_id)
+            return completed
         except Exception:
             pass
         return False
 
 
-# Global instance for easy access
-gamification = GamificationIntegration()
+@lru_cache(maxsize=1)
+def get_gamification() -> GamificationIntegration:
+    """Shared integration instance, created (and its database opened) on first use"""
+    return GamificationIntegration()
 
 
 def track_pose_detection(user_id: str, pose_name: str, confidence: float, 
@@ -154,6 +147,7 @@ def get_user_dashboard_data(user_id: str) -> Dict:
     """
     try:
         # Get user progress
+        gamification = get_gamification()
         progress_summary = gamification.get_user_progress_summary(user_id)
         if not progress_summary:
             return {'error': 'User not found'}
@@ -161,19 +155,12 @@ def get_user_dashboard_data(user_id: str) -> Dict:
         # Get daily challenge
         daily_challenge = gamification.get_daily_challenge_info()
         
-        # Get leaderboard position (simplified)
-        leaderboard = gamification.db.get_leaderboard(limit=100)
-        user_rank = None
-        for i, entry in enumerate(leaderboard):
-            if entry.user_id == user_id:
-                user_rank = i + 1
-                break
-        
+        # Get leaderboard position; the top-N list itself is served by /leaderboard
         return {
             'progress': progress_summary,
             'daily_challenge': daily_challenge,
-            'leaderboard_rank': user_rank,
-            'total_users': len(leaderboard)
+            'leaderboard_rank': gamification.db.get_user_rank(user_id),
+            'total_users': gamification.db.get_total_users()
         }
     except Exception as e:
         return {'error': str(e)}
@@ -1,9 +1,9 @@
 """
 Gamification data models for user progress tracking
 """
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Set
 from datetime import datetime, date
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, field_serializer
 
 
 class UserProgress(BaseModel):
@@ -11,15 +11,19 @@ class UserProgress(BaseModel):
     user_id: str
     total_sessions: int = 0
     total_practice_time: int = 0  # in minutes
-    poses_learned: List[str] = []
+    poses_learned: Set[str] = set()  # stored and returned as a sorted list
     current_streak: int = 0
     longest_streak: int = 0
     last_practice_date: Optional[date] = None
     level: int = 1
     experience_points: int = 0
     achievements: List[str] = []
-    created_at: datetime = datetime.now()
-    updated_at: datetime = datetime.now()
+    created_at: datetime = Field(default_factory=datetime.now)
+    updated_at: datetime = Field(default_factory=datetime.now)
+    
+    @field_serializer("poses_learned")
+    def _serialize_poses_learned(self, poses_learned: Set[str]) -> List[str]:
+        return sorted(poses_learned)
 
 
 class PoseSession(BaseModel):
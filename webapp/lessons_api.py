@@ -1,10 +1,27 @@
 import os
 import json
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Optional
 from fastapi import APIRouter
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 
-router = APIRouter()
+try:
+    import orjson
+except ImportError:  # optional speedup; fall back to the stdlib parser
+    orjson = None
+
+# Lesson payloads are serialized with orjson too when it is available
+router = APIRouter(default_response_class=ORJSONResponse if orjson is not None else JSONResponse)
+
+_SCAN_WORKERS = 8
+_IMG_EXTS = frozenset({"png", "jpg", "jpeg", "gif"})
+
+# (tree signature, items) of the last /lessons/data scan
+_lessons_cache: Optional[tuple] = None
+# (items list it was built from, grouped categories)
+_categories_cache: Optional[tuple] = None
 
 
 def _base_dir() -> str:
@@ -19,6 +36,40 @@ def _asanas_dir() -> str:
     return os.path.join(_base_dir(), "data", "asanas")
 
 
+def _mtime_ns(path: str) -> int:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return 0
+
+
+def _folder_signature(pose_dir: str) -> tuple:
+    """Cheap change marker for one asana folder: stats only, no reads"""
+    return (
+        _mtime_ns(pose_dir),
+        _mtime_ns(os.path.join(pose_dir, "info.json")),
+        _mtime_ns(os.path.join(pose_dir, "images")),
+    )
+
+
+def _is_image(name: str) -> bool:
+    return os.path.splitext(name)[1][1:].lower() in _IMG_EXTS
+
+
+def _read_info(info_path: str) -> dict:
+    """Parse an asana info.json, returning {} when missing or malformed"""
+    try:
+        if not os.path.isfile(info_path):
+            return {}
+        if orjson is not None:
+            with open(info_path, "rb") as f:
+                return orjson.loads(f.read())
+        with open(info_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+
 @router.get("/lessons")
 def lessons_page():
     static_dir = _static_dir()
@@ -27,126 +78,158 @@ def lessons_page():
     return FileResponse(os.path.join(static_dir, "lessons.html"))
 
 
-@router.get("/lessons/data")
-def list_lessons():
+def _load_lesson(entry: os.DirEntry) -> dict:
+    """Build the list entry for one asana folder"""
+    folder = entry.name
+    pose_dir = entry.path
+    info = _read_info(os.path.join(pose_dir, "info.json"))
+
+    # pick first image if exists
+    img_dir = os.path.join(pose_dir, "images")
+    image_rel = None
+    if os.path.isdir(img_dir):
+        with os.scandir(img_dir) as images:
+            for img in images:
+                if _is_image(img.name):
+                    image_rel = f"/assets/asanas/{folder}/images/{img.name}"
+                    break
+
+    return {
+        "id": folder,
+        "name": info.get("name", folder),
+        "english_name": info.get("english_name"),
+        "description": info.get("description"),
+        "image": image_rel,
+    }
+
+
+def _current_lessons() -> list[dict]:
+    """Lesson items for the asana tree, rescanned only when it changes"""
     asanas_path = _asanas_dir()
     lessons_list: list[dict] = []
     if not os.path.isdir(asanas_path):
-        return {"items": lessons_list}
-
-    for folder in sorted(os.listdir(asanas_path)):
-        pose_dir = os.path.join(asanas_path, folder)
-        if not os.path.isdir(pose_dir):
-            continue
-        info_path = os.path.join(pose_dir, "info.json")
-        info: dict = {}
-        try:
-            if os.path.isfile(info_path):
-                with open(info_path, "r", encoding="utf-8") as f:
-                    info = json.load(f)
-        except Exception:
-            info = {}
-
-        # pick first image if exists
-        img_dir = os.path.join(pose_dir, "images")
-        image_rel = None
-        if os.path.isdir(img_dir):
-            for name in os.listdir(img_dir):
-                if name.lower().endswith((".png", ".jpg", ".jpeg", ".gif")):
-                    image_rel = f"/assets/asanas/{folder}/images/{name}"
-                    break
+        return lessons_list
 
-        lessons_list.append({
-            "id": folder,
-            "name": info.get("name", folder),
-            "english_name": info.get("english_name"),
-            "description": info.get("description"),
-            "image": image_rel,
-        })
+    global _lessons_cache
 
-    return {"items": lessons_list}
+    # scandir hands back DirEntry objects whose is_dir() reuses the readdir data
+    with os.scandir(asanas_path) as it:
+        entries = sorted((e for e in it if e.is_dir()), key=lambda e: e.name)
 
+    # The asana tree rarely changes; rescan only when a folder, its info.json
+    # or its images dir has a new mtime
+    signature = (_mtime_ns(asanas_path),) + tuple(
+        (e.name,) + _folder_signature(e.path) for e in entries
+    )
+    cached = _lessons_cache
+    if cached is not None and cached[0] == signature:
+        return cached[1]
 
-def _categories_map() -> dict[str, list[str]]:
-    # Exact titles and entries as requested (strings must match lesson keys)
-    return {
-        "🧘‍♂️ 1. Beginner-Friendly Poses": [
-            "Balasana (Child's Pose)",
-            "Bitilasana (Cow Pose)",
-            "Marjaryasana (Cat Pose)",
-            "Tadasana (Mountain Pose)",
-            "Padmasana (Lotus Pose)",
-            "Baddha Konasana (Butterfly Pose)",
-            "Sivasana (Corpse Pose)",
-            "Utkatasana (Chair Pose)",
-            "Vrksasana (Tree Pose)",
-            "Trikonasana (Triangle Pose)",
-            "Virabhadrasana One (Warrior I)",
-            "Virabhadrasana Two (Warrior II)",
-        ],
-        "🧘‍♀️ 2. Good for Flexibility": [
-            "Hanumanasana (Monkey Pose)",
-            "Upavistha Konasana (Wide-Angle Seated Forward Bend)",
-            "Uttanasana (Standing Forward Bend)",
-            "Parsvottanasana (Pyramid Pose)",
-            "Paschimottanasana (Seated Forward Bend)",
-            "Urdhva Dhanurasana (Upward-Facing Bow Pose)",
-            "Halasana (Plow Pose)",
-            "Eka Pada Rajakapotasana (One-Legged King Pigeon Pose)",
-            "Ardha Chandrasana (Half Moon Pose)",
-            "Ardha Matsyendrasana (Half Lord of the Fishes Pose)",
-        ],
-        "🧍 3. Good for Spine & Back": [
-            "Dhanurasana (Bow Pose)",
-            "Urdhva Mukha Svsnssana (Upward-Facing Dog Pose)",
-            "Salamba Bhujangasana (Sphinx Pose)",
-            "Setu Bandha Sarvangasana (Bridge Pose)",
-            "Ardha Matsyendrasana (Half Lord of the Fishes Pose)",
-            "Ustrasana (Camel Pose)",
-            "Camatkarasana (Wild Thing Pose)",
-            "Bitilasana (Cow Pose)",
-            "Marjaryasana (Cat Pose)",
-        ],
-        "🧎 4. Great for Core Strength": [
-            "Navasana (Boat Pose)",
-            "Ardha Navasana (Half Boat Pose)",
-            "Phalakasana (Plank Pose)",
-            "Vasisthasana (Side Plank Pose)",
-            "Utkatasana (Chair Pose)",
-        ],
-        "🦵 5. Knee-Friendly / Strengthen Knees": [
-            "Utkatasana (Chair Pose)",
-            "Virabhadrasana One (Warrior I)",
-            "Virabhadrasana Two (Warrior II)",
-            "Virabhadrasana Three (Warrior III)",
-            "Trikonasana (Triangle Pose)",
-            "Utthita Parsvakonasana (Extended Side Angle Pose)",
-            "Utthita Hasta Padangusthasana (Extended Hand-to-Big-Toe Pose)",
-        ],
-        "🧠 6. Good for Balance & Focus": [
-            "Vrksasana (Tree Pose)",
-            "Ardha Chandrasana (Half Moon Pose)",
-            "Garudasana (Eagle Pose)",
-            "Utthita Hasta Padangusthasana (Extended Hand-to-Big-Toe Pose)",
-            "Vasisthasana (Side Plank Pose)",
-            "Bakasana (Crow Pose)",
-            "Pincha Mayurasana (Feathered Peacock Pose)",
-            "Adho Mukha Vrksasana (Handstand)",
-        ],
-        "🛏️ 7. Relaxation & Cooling Down": [
-            "Balasana (Child's Pose)",
-            "Sivasana (Corpse Pose)",
-            "Supta Kapotasana (Reclining Pigeon Pose)",
-            "Baddha Konasana (Butterfly Pose)",
-            "Halasana (Plow Pose)",
-        ],
-    }
+    # Each folder is a handful of small reads; overlap them across a few threads.
+    # map() keeps the sorted order.
+    with ThreadPoolExecutor(max_workers=_SCAN_WORKERS) as pool:
+        lessons_list.extend(pool.map(_load_lesson, entries))
+
+    _lessons_cache = (signature, lessons_list)
+    return lessons_list
+
+
+@router.get("/lessons/data")
+def list_lessons():
+    return {"items": list(_current_lessons())}
+
+
+def preload_lessons() -> None:
+    """Parse every asana folder once so the first /lessons request hits the cache"""
+    _current_lessons()
+
+
+# Exact titles and entries as requested (strings must match lesson keys)
+_CATEGORIES_MAP: dict[str, list[str]] = {
+    "🧘‍♂️ 1. Beginner-Friendly Poses": [
+        "Balasana (Child's Pose)",
+        "Bitilasana (Cow Pose)",
+        "Marjaryasana (Cat Pose)",
+        "Tadasana (Mountain Pose)",
+        "Padmasana (Lotus Pose)",
+        "Baddha Konasana (Butterfly Pose)",
+        "Sivasana (Corpse Pose)",
+        "Utkatasana (Chair Pose)",
+        "Vrksasana (Tree Pose)",
+        "Trikonasana (Triangle Pose)",
+        "Virabhadrasana One (Warrior I)",
+        "Virabhadrasana Two (Warrior II)",
+    ],
+    "🧘‍♀️ 2. Good for Flexibility": [
+        "Hanumanasana (Monkey Pose)",
+        "Upavistha Konasana (Wide-Angle Seated Forward Bend)",
+        "Uttanasana (Standing Forward Bend)",
+        "Parsvottanasana (Pyramid Pose)",
+        "Paschimottanasana (Seated Forward Bend)",
+        "Urdhva Dhanurasana (Upward-Facing Bow Pose)",
+        "Halasana (Plow Pose)",
+        "Eka Pada Rajakapotasana (One-Legged King Pigeon Pose)",
+        "Ardha Chandrasana (Half Moon Pose)",
+        "Ardha Matsyendrasana (Half Lord of the Fishes Pose)",
+    ],
+    "🧍 3. Good for Spine & Back": [
+        "Dhanurasana (Bow Pose)",
+        "Urdhva Mukha Svsnssana (Upward-Facing Dog Pose)",
+        "Salamba Bhujangasana (Sphinx Pose)",
+        "Setu Bandha Sarvangasana (Bridge Pose)",
+        "Ardha Matsyendrasana (Half Lord of the Fishes Pose)",
+        "Ustrasana (Camel Pose)",
+        "Camatkarasana (Wild Thing Pose)",
+        "Bitilasana (Cow Pose)",
+        "Marjaryasana (Cat Pose)",
+    ],
+    "🧎 4. Great for Core Strength": [
+        "Navasana (Boat Pose)",
+        "Ardha Navasana (Half Boat Pose)",
+        "Phalakasana (Plank Pose)",
+        "Vasisthasana (Side Plank Pose)",
+        "Utkatasana (Chair Pose)",
+    ],
+    "🦵 5. Knee-Friendly / Strengthen Knees": [
+        "Utkatasana (Chair Pose)",
+        "Virabhadrasana One (Warrior I)",
+        "Virabhadrasana Two (Warrior II)",
+        "Virabhadrasana Three (Warrior III)",
+        "Trikonasana (Triangle Pose)",
+        "Utthita Parsvakonasana (Extended Side Angle Pose)",
+        "Utthita Hasta Padangusthasana (Extended Hand-to-Big-Toe Pose)",
+    ],
+    "🧠 6. Good for Balance & Focus": [
+        "Vrksasana (Tree Pose)",
+        "Ardha Chandrasana (Half Moon Pose)",
+        "Garudasana (Eagle Pose)",
+        "Utthita Hasta Padangusthasana (Extended Hand-to-Big-Toe Pose)",
+        "Vasisthasana (Side Plank Pose)",
+        "Bakasana (Crow Pose)",
+        "Pincha Mayurasana (Feathered Peacock Pose)",
+        "Adho Mukha Vrksasana (Handstand)",
+    ],
+    "🛏️ 7. Relaxation & Cooling Down": [
+        "Balasana (Child's Pose)",
+        "Sivasana (Corpse Pose)",
+        "Supta Kapotasana (Reclining Pigeon Pose)",
+        "Baddha Konasana (Butterfly Pose)",
+        "Halasana (Plow Pose)",
+    ],
+}
 
 
 @router.get("/lessons/categories")
 def lessons_categories():
+    global _categories_cache
+
+    # The grouping only changes when the lesson items are rebuilt
+    all_items = _current_lessons()
+    cached = _categories_cache
+    if cached is not None and cached[0] is all_items:
+        return cached[1]
+
     # Build a lookup for multiple display variants per lesson
-    all_items = list_lessons()["items"]
     name_to_item: dict[str, dict] = {}
     for it in all_items:
         base_name = (it.get("name") or "").strip()
@@ -157,7 +240,7 @@ def lessons_categories():
             if eng:
                 name_to_item[f"{base_name} ({eng})"] = it
     grouped: dict[str, list[dict]] = {}
-    for title, pose_names in _categories_map().items():
+    for title, pose_names in _CATEGORIES_MAP.items():
         items: list[dict] = []
         for name in pose_names:
             match = name_to_item.get(name)
@@ -165,6 +248,7 @@ def lessons_categories():
                 items.append(match)
         if items:
             grouped[title] = items
+    _categories_cache = (all_items, grouped)
     return grouped
 
 
@@ -181,24 +265,24 @@ def lesson_detail(lesson_id: str):
     pose_dir = os.path.join(_asanas_dir(), lesson_id)
     if not os.path.isdir(pose_dir):
         return JSONResponse(status_code=404, content={"error": "lesson not found"})
+    return _lesson_detail(lesson_id, pose_dir, _folder_signature(pose_dir))
+
+
+@lru_cache(maxsize=128)
+def _lesson_detail(lesson_id: str, pose_dir: str, signature: tuple) -> dict:
+    # signature only keys the cache; a changed folder gets a fresh entry
 
     # info
-    info: dict = {}
-    info_path = os.path.join(pose_dir, "info.json")
-    try:
-        if os.path.isfile(info_path):
-            with open(info_path, "r", encoding="utf-8") as f:
-                info = json.load(f)
-    except Exception:
-        info = {}
+    info = _read_info(os.path.join(pose_dir, "info.json"))
 
     # images
     images: list[str] = []
     img_dir = os.path.join(pose_dir, "images")
     if os.path.isdir(img_dir):
-        for name in sorted(os.listdir(img_dir)):
-            if name.lower().endswith((".png", ".jpg", ".jpeg", ".gif")):
-                images.append(f"/assets/asanas/{lesson_id}/images/{name}")
+        with os.scandir(img_dir) as it:
+            names = sorted(e.name for e in it if _is_image(e.name))
+        for name in names:
+            images.append(f"/assets/asanas/{lesson_id}/images/{name}")
 
     return {
         "id": lesson_id,
@@ -1,29 +1,57 @@
-import io
+import asyncio
+import hashlib
 import os
 import sys
-from typing import Tuple
+import threading
+from contextlib import asynccontextmanager
+from typing import BinaryIO, Dict, Tuple
 
 import numpy as np
-from fastapi import FastAPI, File, UploadFile
-from fastapi.middleware.cors import CORSMiddlewareimage.png
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi import FastAPI, File, Request, Response, UploadFile
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 import json
 try:
     # When running as a module (uvicorn webapp.main:app)
     from .lessons_api import router as lessons_router  # type: ignore
+    from .lessons_api import preload_lessons  # type: ignore
     from .gamification.api import router as gamification_router  # type: ignore
     from .auth.api import router as auth_router  # type: ignore
+    from .auth.api import periodic_session_cleanup  # type: ignore
+    from .yoga_common import CLASS_NAMES  # type: ignore
 except Exception:
     # When running directly (python webapp/main.py)
     from lessons_api import router as lessons_router  # type: ignore
+    from lessons_api import preload_lessons  # type: ignore
     from gamification.api import router as gamification_router  # type: ignore
     from auth.api import router as auth_router  # type: ignore
+    from auth.api import periodic_session_cleanup  # type: ignore
+    from yoga_common import CLASS_NAMES  # type: ignore
 from PIL import Image
+
+# Must be set before TensorFlow is imported; deployments can override them
+os.environ.setdefault("TF_ENABLE_ONEDNN_OPTS", "1")
+os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
 import tensorflow as tf
 
 
+def _usable_cpus() -> int:
+    """CPUs this process may run on; os.cpu_count() reports every host core"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+# Size TF's pools explicitly: one batch runs at a time, so let it use every
+# usable core, and keep few inter-op threads to avoid oversubscribing the server
+TF_INTRA_OP_THREADS = int(os.environ.get("TF_INTRA_OP_THREADS", _usable_cpus()))
+TF_INTER_OP_THREADS = int(os.environ.get("TF_INTER_OP_THREADS", 2))
+tf.config.threading.set_intra_op_parallelism_threads(TF_INTRA_OP_THREADS)
+tf.config.threading.set_inter_op_parallelism_threads(TF_INTER_OP_THREADS)
+
+
 def resource_path(relative_path: str) -> str:
     try:
         base_path = sys._MEIPASS  # type: ignore[attr-defined]
@@ -33,86 +61,176 @@ def resource_path(relative_path: str) -> str:
     return os.path.join(base_path, relative_path)
 
 
-CLASS_NAMES = [
-   "Adho Mukha Svanasana",
-"Adho Mukha Vrksasana",
-"Alanasana",
-"Anjaneyasana",
-"Ardha Chandrasana",
-"Ardha Matsyendrasana",
-"Ardha Navasana",
-"Ardha Pincha Mayurasana",
-"Ashta Chandrasana",
-"Baddha Konasana",
-"Bakasana",
-"Balasana",
-"Bitilasana",
-"Camatkarasana",
-"Dhanurasana",
-"Eka Pada Rajakapotasana",
-"Garudasana",
-"Halasana",
-"Hanumanasana",
-"Malasana",
-"Marjaryasana",
-"Navasana",
-"Padmasana",
-"Parsva Virabhadrasana",
-"Parsvottanasana",
-"Paschimottanasana",
-"Phalakasana",
-"Pincha Mayurasana",
-"Salamba Bhujangasana",
-"Salamba Sarvangasana",
-"Setu Bandha Sarvangasana",
-"Sivasana",
-"Supta Kapotasana",
-"Trikonasana",
-"Upavistha Konasana",
-"Urdhva Dhanurasana",
-"Urdhva Mukha Svsnssana",
-"Ustrasana",
-"Utkatasana",
-"Uttanasana",
-"Utthita Hasta Padangusthasana",
-"Utthita Parsvakonasana",
-"Vasisthasana",
-"Virabhadrasana One",
-"Virabhadrasana Three",
-"Virabhadrasana Two",
-"Vrksasana"
-]
+model: tf.keras.Model | None = None
+# Forward pass traced once at load; Keras predict() rebuilds its loop per call
+infer = None
 
+INPUT_SIGNATURE = tf.TensorSpec(shape=(None, 224, 224, 3), dtype=tf.float32)
 
-model: tf.keras.Model | None = None
+# Keeps concurrent first calls from loading the model twice
+_model_lock = threading.Lock()
 
 
 def load_model() -> tf.keras.Model:
-    global model
-    if model is None:
+    global model, infer
+    if model is not None:
+        return model
+    with _model_lock:
+        if model is not None:
+            return model
         model_path = resource_path("yoga_pose_finetuned_model.keras")
-        model = tf.keras.models.load_model(model_path)
-    return model
+        mdl = tf.keras.models.load_model(model_path)
+        # Every output index must name a class, so predictions need no bounds check
+        if mdl.output_shape[-1] != len(CLASS_NAMES):
+            raise RuntimeError(
+                f"model predicts {mdl.output_shape[-1]} classes, expected {len(CLASS_NAMES)}"
+            )
+        infer = tf.function(
+            lambda x: mdl(x, training=False), input_signature=[INPUT_SIGNATURE]
+        ).get_concrete_function()
+        model = mdl
+        return model
+
+
+def warmup_model():
+    """Load the model and run one dummy batch so TF initializes its kernels now"""
+    run_model(np.zeros((1, 224, 224, 3), dtype=np.float32))
 
 
 def preprocess_image(image: Image.Image) -> np.ndarray:
     image = image.convert("RGB").resize((224, 224))
-    img_array = np.array(image, dtype=np.float32) / 255.0
-    img_array = np.expand_dims(img_array, axis=0)
-    return img_array
+    # Scale the uint8 pixels straight into float32 in one pass; the batch
+    # axis is a view, not another copy
+    img_array = np.divide(np.asarray(image), np.float32(255), dtype=np.float32)
+    return img_array[np.newaxis]
 
 
-def predict_pose_from_image(image: Image.Image) -> Tuple[str, float]:
-    mdl = load_model()
-    input_tensor = preprocess_image(image)
-    preds = mdl.predict(input_tensor, verbose=0)[0]
-    idx = int(np.argmax(preds))
-    confidence = float(preds[idx])
-    pose_name = CLASS_NAMES[idx] if 0 <= idx < len(CLASS_NAMES) else str(idx)
-    return pose_name, confidence
+def decode_upload(fileobj: BinaryIO) -> np.ndarray:
+    """Decode an uploaded image file into a model input"""
+    return preprocess_image(Image.open(fileobj))
+
 
+def run_model(batch: np.ndarray) -> np.ndarray:
+    """Class scores for a (N, 224, 224, 3) batch of preprocessed images"""
+    load_model()
+    return infer(tf.constant(batch)).numpy()
 
-app = FastAPI(title="Yoga Pose Analyzer Web API", version="1.0.0")
+
+def top_pose(preds: np.ndarray) -> Tuple[str, float]:
+    idx = int(np.argmax(preds))
+    confidence = float(preds[idx])
+    return CLASS_NAMES[idx], confidence
+
+
+def predict_pose_from_image(image: Image.Image) -> Tuple[str, float, np.ndarray]:
+    """Top pose, its confidence and the full score vector from one forward pass"""
+    preds = run_model(preprocess_image(image))[0]
+    pose_name, confidence = top_pose(preds)
+    return pose_name, confidence, preds
+
+
+PREDICT_MAX_BATCH = 16
+PREDICT_MAX_WAIT = 0.01  # seconds the first request waits for others to join
+
+
+class PredictBatcher:
+    """Coalesces concurrent /predict inputs into one batched forward pass"""
+
+    def __init__(self, max_batch: int = PREDICT_MAX_BATCH, max_wait: float = PREDICT_MAX_WAIT):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        # Created by start() so both belong to the loop that is running then
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._cancel_queued()
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._cancel_queued()
+        self._queue = None
+
+    def _cancel_queued(self):
+        """Release requests still waiting in a queue nothing will serve"""
+        if self._queue is None:
+            return
+        while not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            future.cancel()
+
+    async def predict(self, input_tensor: np.ndarray) -> np.ndarray:
+        """Scores for one preprocessed (1, 224, 224, 3) input"""
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((input_tensor, future))
+        return await future
+
+    async def _collect(self) -> list:
+        loop = asyncio.get_running_loop()
+        items = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(items) < self.max_batch:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                items.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return items
+
+    async def _run(self):
+        while True:
+            items = await self._collect()
+            try:
+                await self._serve(items)
+            except asyncio.CancelledError:
+                for _, future in items:
+                    future.cancel()
+                raise
+            except Exception as exc:
+                # Any failure goes to the requests in this batch; the loop keeps serving
+                for _, future in items:
+                    if not future.done():
+                        future.set_exception(exc)
+
+    async def _serve(self, items: list):
+        # Requests whose client went away are dropped before inference
+        items = [(tensor, future) for tensor, future in items if not future.done()]
+        if not items:
+            return
+        batch = np.concatenate([tensor for tensor, _ in items])
+        # One batch at a time, off the event loop
+        preds = await asyncio.to_thread(run_model, batch)
+        for (_, future), scores in zip(items, preds):
+            if not future.done():
+                future.set_result(scores)
+
+
+predict_batcher = PredictBatcher()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Lesson data is static; parse it before the first request arrives
+    await asyncio.to_thread(preload_lessons)
+    # Pay the model load and first-inference cost before serving, not on a request
+    await asyncio.to_thread(warmup_model)
+    # Expired auth sessions are purged in the background instead of on demand
+    cleanup_task = asyncio.create_task(periodic_session_cleanup())
+    predict_batcher.start()
+    yield
+    predict_batcher.stop()
+    cleanup_task.cancel()
+
+
+app = FastAPI(title="Yoga Pose Analyzer Web API", version="1.0.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -123,45 +241,67 @@ app.add_middleware(
 )
 
 static_dir = os.path.join(os.path.dirname(__file__), "static")
+
+# filename -> (mtime_ns, body, etag) of the pages served below
+_page_cache: Dict[str, tuple] = {}
+
+
+def _page_response(request: Request, filename: str) -> Response:
+    """HTML page from memory with an ETag; 304 if the client's copy is current"""
+    path = os.path.join(static_dir, filename)
+    mtime = os.stat(path).st_mtime_ns
+    cached = _page_cache.get(filename)
+    if cached is None or cached[0] != mtime:
+        # Re-read only after the file changes on disk
+        with open(path, "rb") as f:
+            body = f.read()
+        etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+        cached = _page_cache[filename] = (mtime, body, etag)
+    _, body, etag = cached
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="text/html", headers=headers)
+
+
 if os.path.isdir(static_dir):
     app.mount("/static", StaticFiles(directory=static_dir), name="static")
 
     @app.get("/")
-    def serve_index():
-        index_path = os.path.join(static_dir, "index.html")
-        return FileResponse(index_path)
+    def serve_index(request: Request):
+        return _page_response(request, "index.html")
 
     @app.get("/session")
-    def serve_session():
-        return FileResponse(os.path.join(static_dir, "session.html"))
+    def serve_session(request: Request):
+        return _page_response(request, "session.html")
 
     @app.get("/dashboard")
-    def serve_dashboard():
-        return FileResponse(os.path.join(static_dir, "dashboard.html"))
+    def serve_dashboard(request: Request):
+        return _page_response(request, "dashboard.html")
 
     @app.get("/shop")
-    def serve_shop():
-        return FileResponse(os.path.join(static_dir, "shop.html"))
+    def serve_shop(request: Request):
+        return _page_response(request, "shop.html")
 
     @app.get("/cart")
-    def serve_cart():
-        return FileResponse(os.path.join(static_dir, "cart.html"))
+    def serve_cart(request: Request):
+        return _page_response(request, "cart.html")
 
     @app.get("/checkout")
-    def serve_checkout():
-        return FileResponse(os.path.join(static_dir, "checkout.html"))
+    def serve_checkout(request: Request):
+        return _page_response(request, "checkout.html")
 
     @app.get("/book-instructor")
-    def serve_book_instructor():
-        return FileResponse(os.path.join(static_dir, "book-instructor.html"))
+    def serve_book_instructor(request: Request):
+        return _page_response(request, "book-instructor.html")
 
     @app.get("/login")
-    def serve_login():
-        return FileResponse(os.path.join(static_dir, "login.html"))
+    def serve_login(request: Request):
+        return _page_response(request, "login.html")
 
     @app.get("/instructions")
-    def serve_instructions():
-        return FileResponse(os.path.join(static_dir, "instructions.html"))
+    def serve_instructions(request: Request):
+        return _page_response(request, "instructions.html")
 
 # Mount the data directory as read-only assets so images/json can be fetched by the frontend
 assets_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data"))
@@ -180,6 +320,12 @@ app.include_router(gamification_router)
 app.include_router(auth_router)
 
 
+@app.exception_handler(Exception)
+async def unhandled_exception_handler(request: Request, exc: Exception):
+    # Routers raise HTTPException for expected 4xx cases; anything else lands here
+    return JSONResponse(status_code=500, content={"detail": str(exc)})
+
+
 @app.get("/health")
 def health():
     return {"status": "ok"}
@@ -188,17 +334,15 @@ def health():
 @app.post("/predict")
 async def predict(file: UploadFile = File(...)):
     try:
-        contents = await file.read()
-        image = Image.open(io.BytesIO(contents))
-        pose_name, confidence = predict_pose_from_image(image)
-        
-        # Debug: Get all predictions to see distribution
-        mdl = load_model()
-        input_tensor = preprocess_image(image)
-        preds = mdl.predict(input_tensor, verbose=0)[0]
+        # PIL reads the spooled upload directly instead of a full in-memory copy;
+        # decoding and resizing are CPU-bound, so keep them off the event loop
+        input_tensor = await asyncio.to_thread(decode_upload, file.file)
+        preds = await predict_batcher.predict(input_tensor)
+        pose_name, confidence = top_pose(preds)
         
-        # Get top 3 predictions for debugging
-        top_indices = np.argsort(preds)[-3:][::-1]
+        # Get top 3 predictions for debugging, from the same scores
+        top_indices = np.argpartition(preds, -3)[-3:]
+        top_indices = top_indices[np.argsort(-preds[top_indices])]
         top_predictions = [
             {"pose": CLASS_NAMES[i], "confidence": float(preds[i])} 
             for i in top_indices
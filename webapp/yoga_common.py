@@ -0,0 +1,53 @@
+"""
+Pose classes predicted by the yoga pose model, in model output order
+"""
+
+CLASS_NAMES: tuple[str, ...] = (
+    "Adho Mukha Svanasana",
+    "Adho Mukha Vrksasana",
+    "Alanasana",
+    "Anjaneyasana",
+    "Ardha Chandrasana",
+    "Ardha Matsyendrasana",
+    "Ardha Navasana",
+    "Ardha Pincha Mayurasana",
+    "Ashta Chandrasana",
+    "Baddha Konasana",
+    "Bakasana",
+    "Balasana",
+    "Bitilasana",
+    "Camatkarasana",
+    "Dhanurasana",
+    "Eka Pada Rajakapotasana",
+    "Garudasana",
+    "Halasana",
+    "Hanumanasana",
+    "Malasana",
+    "Marjaryasana",
+    "Navasana",
+    "Padmasana",
+    "Parsva Virabhadrasana",
+    "Parsvottanasana",
+    "Paschimottanasana",
+    "Phalakasana",
+    "Pincha Mayurasana",
+    "Salamba Bhujangasana",
+    "Salamba Sarvangasana",
+    "Setu Bandha Sarvangasana",
+    "Sivasana",
+    "Supta Kapotasana",
+    "Trikonasana",
+    "Upavistha Konasana",
+    "Urdhva Dhanurasana",
+    "Urdhva Mukha Svsnssana",
+    "Ustrasana",
+    "Utkatasana",
+    "Uttanasana",
+    "Utthita Hasta Padangusthasana",
+    "Utthita Parsvakonasana",
+    "Vasisthasana",
+    "Virabhadrasana One",
+    "Virabhadrasana Three",
+    "Virabhadrasana Two",
+    "Vrksasana",
+)